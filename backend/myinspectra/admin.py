@@ -1,4 +1,12 @@
+import functools
+import time
+
 from django.contrib import admin
+from django.core.files.storage import default_storage
+from django.db.models import Count
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.encoding import filepath_to_uri
 from .models import CXRModel, RawImage, CaseRequest, Prediction, Heatmap, Segment, OverlayHeatmap, PredictionProfile, DicomFile, ProcessedHeatmap
 
 # Configure admin site headers and titles
@@ -7,12 +15,47 @@ admin.site.site_title = "MyInspectra Admin Portal"
 admin.site.index_title = "Welcome to MyInspectra Administration"
 
 
+@functools.cache
+def _media_base_url():
+    """Resolve the public URL prefix of the default storage once."""
+    # Storage serves unsigned public URLs (querystring_auth=False), so every file URL
+    # is this prefix plus the file name; no need to ask the storage backend per row.
+    return default_storage.url('_').removesuffix('_')
+
+
+@functools.lru_cache(maxsize=4096)
+def _signed_url(name, window):
+    return default_storage.url(name)
+
+
+def media_url(field_file):
+    """Public URL of a stored file built by string concat instead of storage.url()."""
+    if getattr(default_storage, 'querystring_auth', False):
+        # Signed URLs expire, so cache them per half-expiry window rather than forever
+        window = int(time.time() // max(default_storage.querystring_expire // 2, 1))
+        return _signed_url(field_file.name, window)
+    return _media_base_url() + filepath_to_uri(field_file.name)
+
+
+class OptInInlinesMixin:
+    """Only render inline formsets when the change page is opened with ?show_inlines=1"""
+
+    def get_inlines(self, request, obj):
+        if request.GET.get('show_inlines') == '1':
+            return super().get_inlines(request, obj)
+        return []
+
+
 # Define inline classes first (before they're used)
 class PredictionInline(admin.TabularInline):
     model = Prediction
     extra = 0
     readonly_fields = ['created_at', 'updated_at']
 
+    def get_queryset(self, request):
+        # Row labels use case_request; heatmap is a reverse one-to-one, so JOIN it too
+        return super().get_queryset(request).select_related('case_request', 'heatmap')
+
 
 class HeatmapInline(admin.StackedInline):
     model = Heatmap
@@ -21,7 +64,7 @@ class HeatmapInline(admin.StackedInline):
 
     def heatmap_url(self, obj):
         if obj.heatmap_image:
-            return obj.heatmap_image.url
+            return media_url(obj.heatmap_image)
         return "No heatmap"
     heatmap_url.short_description = 'Heatmap URL'
 
@@ -32,6 +75,10 @@ class CXRModelAdmin(admin.ModelAdmin):
     list_filter = ['is_active', 'version', 'service_type']
     search_fields = ['name', 'version']
 
+    def get_queryset(self, request):
+        # description is a TEXT column the changelist never shows
+        return super().get_queryset(request).defer('description')
+
 
 @admin.register(PredictionProfile)
 class PredictionProfileAdmin(admin.ModelAdmin):
@@ -40,15 +87,43 @@ class PredictionProfileAdmin(admin.ModelAdmin):
     search_fields = ['name']
     filter_horizontal = ['cxr_models']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('description')
+
 
 @admin.register(CaseRequest)
-class CaseRequestAdmin(admin.ModelAdmin):
-    list_display = ['request_id', 'created_at', 'is_image_uploaded', 'is_prediction_generated', 'is_success_response']
-    list_filter = ['created_at']
+class CaseRequestAdmin(OptInInlinesMixin, admin.ModelAdmin):
+    list_display = ['request_id', 'created_at', 'is_image_uploaded', 'is_prediction_generated', 'is_success_response', 'pred_count', 'seg_count']
+    list_filter = [('created_at', admin.DateFieldListFilter)]
+    date_hierarchy = 'created_at'
     search_fields = ['request_id']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'predictions_link']
+    list_per_page = 50
+    show_full_result_count = False
     inlines = [PredictionInline]
 
+    def get_queryset(self, request):
+        # Aggregate related counts in the changelist query instead of a COUNT per row
+        return super().get_queryset(request).annotate(
+            _pred_count=Count('predictions', distinct=True),
+            _seg_count=Count('segments', distinct=True),
+        )
+
+    def pred_count(self, obj):
+        return obj._pred_count
+    pred_count.short_description = 'Predictions'
+    pred_count.admin_order_field = '_pred_count'
+
+    def seg_count(self, obj):
+        return obj._seg_count
+    seg_count.short_description = 'Segments'
+    seg_count.admin_order_field = '_seg_count'
+
+    def predictions_link(self, obj):
+        url = reverse('admin:myinspectra_prediction_changelist')
+        return format_html('<a href="{}?case_request__id__exact={}">{} predictions</a>', url, obj.pk, obj._pred_count)
+    predictions_link.short_description = 'Predictions'
+
     def is_image_uploaded(self, obj):
         return obj.success_upload
     is_image_uploaded.boolean = True
@@ -68,32 +143,69 @@ class CaseRequestAdmin(admin.ModelAdmin):
 @admin.register(RawImage)
 class RawImageAdmin(admin.ModelAdmin):
     list_display = ['case_request', 'image', 'original_filename', 'width', 'height', 'file_size', 'created_at']
-    list_filter = ['content_type', 'created_at']
+    list_filter = ['content_type', ('created_at', admin.DateFieldListFilter)]
+    date_hierarchy = 'created_at'
     search_fields = ['case_request__request_id', 'original_filename']
     readonly_fields = ['created_at', 'updated_at', 'image_url']
+    list_select_related = ['case_request']
+    list_per_page = 50
+    show_full_result_count = False
+    autocomplete_fields = ['case_request']
 
     def image_url(self, obj):
         if obj.image:
-            return obj.image.url
+            return media_url(obj.image)
         return "No image"
     image_url.short_description = 'Image URL'
 
 
 @admin.register(Prediction)
-class PredictionAdmin(admin.ModelAdmin):
-    list_display = ['case_request', 'disease_name', 'model_version', 'prediction_value', 'balanced_score', 'thresholded_percentage', 'created_at']
-    list_filter = ['disease_name', 'model_version', 'created_at']
+class PredictionAdmin(OptInInlinesMixin, admin.ModelAdmin):
+    list_display = ['case_request', 'disease_name', 'model_version', 'prediction_value', 'balanced_score', 'get_thresholded', 'created_at']
+    list_filter = ['disease_name', 'model_version', ('created_at', admin.DateFieldListFilter)]
+    date_hierarchy = 'created_at'
     search_fields = ['case_request__request_id', 'disease_name']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'heatmap_link']
+    list_select_related = ['case_request']
+    list_per_page = 50
+    show_full_result_count = False
+    autocomplete_fields = ['case_request']
     inlines = [HeatmapInline]
 
+    def get_queryset(self, request):
+        # Change view and __str__ also dereference case_request, not just the changelist
+        return super().get_queryset(request).select_related('case_request')
+
+    def heatmap_link(self, obj):
+        heatmap = getattr(obj, 'heatmap', None)
+        if heatmap is None:
+            return "No heatmap"
+        url = reverse('admin:myinspectra_heatmap_change', args=[heatmap.pk])
+        return format_html('<a href="{}">View heatmap</a>', url)
+    heatmap_link.short_description = 'Heatmap'
+
+    def get_thresholded(self, obj):
+        return obj.thresholded_percentage
+    get_thresholded.short_description = 'Thresholded percentage'
+    get_thresholded.admin_order_field = 'thresholded_value'
+
 
 @admin.register(Heatmap)
 class HeatmapAdmin(admin.ModelAdmin):
     list_display = ['prediction', 'heatmap_image','get_disease_name', 'get_model_version', 'get_case_request', 'width', 'height', 'file_size', 'created_at']
-    list_filter = ['prediction__disease_name', 'prediction__model_version', 'created_at']
-    search_fields = ['prediction__case_request__request_id', 'prediction__disease_name']
+    list_filter = ['prediction__disease_name', 'prediction__model_version', ('created_at', admin.DateFieldListFilter)]
+    date_hierarchy = 'created_at'
+    search_fields = ['case_request__request_id', 'prediction__disease_name']
     readonly_fields = ['created_at', 'updated_at', 'heatmap_url']
+    list_select_related = ['prediction__case_request', 'case_request']
+    list_per_page = 50
+    show_full_result_count = False
+    autocomplete_fields = ['prediction']
+
+    def get_queryset(self, request):
+        # The prediction column's __str__ still walks prediction -> case_request;
+        # the Case Request column, search and ordering use the denormalized FK
+        return super().get_queryset(request).select_related('prediction__case_request', 'case_request')
 
     def get_disease_name(self, obj):
         return obj.prediction.disease_name
@@ -106,26 +218,31 @@ class HeatmapAdmin(admin.ModelAdmin):
     get_model_version.admin_order_field = 'prediction__model_version'
 
     def get_case_request(self, obj):
-        return obj.prediction.case_request.request_id
+        return obj.get_case_request().request_id
     get_case_request.short_description = 'Case Request'
-    get_case_request.admin_order_field = 'prediction__case_request__request_id'
+    get_case_request.admin_order_field = 'case_request__request_id'
 
     def heatmap_url(self, obj):
         if obj.heatmap_image:
-            return obj.heatmap_image.url
+            return media_url(obj.heatmap_image)
         return "No heatmap"
     heatmap_url.short_description = 'Heatmap URL'
 
 @admin.register(Segment)
 class SegmentAdmin(admin.ModelAdmin):
     list_display = ['case_request', 'segment_image', 'class_name', 'model_version', 'width', 'height', 'file_size', 'created_at']
-    list_filter = ['class_name', 'model_version', 'created_at']
+    list_filter = ['class_name', 'model_version', ('created_at', admin.DateFieldListFilter)]
+    date_hierarchy = 'created_at'
     search_fields = ['case_request__request_id', 'class_name']
     readonly_fields = ['created_at', 'updated_at', 'segment_image_url']
+    list_select_related = ['case_request']
+    list_per_page = 50
+    show_full_result_count = False
+    autocomplete_fields = ['case_request']
 
     def segment_image_url(self, obj):
         if obj.segment_image:
-            return obj.segment_image.url
+            return media_url(obj.segment_image)
         return "No segment image"
     segment_image_url.short_description = 'Segment Image URL'
 
@@ -133,13 +250,18 @@ class SegmentAdmin(admin.ModelAdmin):
 @admin.register(OverlayHeatmap)
 class OverlayHeatmapAdmin(admin.ModelAdmin):
     list_display = ['case_request', 'version', 'overlay_image', 'width', 'height', 'file_size', 'created_at']
-    list_filter = ['version', 'created_at']
+    list_filter = ['version', ('created_at', admin.DateFieldListFilter)]
+    date_hierarchy = 'created_at'
     search_fields = ['case_request__request_id']
     readonly_fields = ['created_at', 'updated_at', 'overlay_image_url']
+    list_select_related = ['case_request']
+    list_per_page = 50
+    show_full_result_count = False
+    autocomplete_fields = ['case_request']
 
     def overlay_image_url(self, obj):
         if obj.overlay_image:
-            return obj.overlay_image.url
+            return media_url(obj.overlay_image)
         return "No overlay image"
     overlay_image_url.short_description = 'Overlay Image URL'
 
@@ -147,13 +269,18 @@ class OverlayHeatmapAdmin(admin.ModelAdmin):
 @admin.register(DicomFile)
 class DicomFileAdmin(admin.ModelAdmin):
     list_display = ['case_request', 'file', 'original_filename', 'file_size', 'created_at']
-    list_filter = ['created_at']
+    list_filter = [('created_at', admin.DateFieldListFilter)]
+    date_hierarchy = 'created_at'
     search_fields = ['case_request__request_id', 'original_filename']
     readonly_fields = ['created_at', 'file_url']
+    list_select_related = ['case_request']
+    list_per_page = 50
+    show_full_result_count = False
+    autocomplete_fields = ['case_request']
 
     def file_url(self, obj):
         if obj.file:
-            return obj.file.url
+            return media_url(obj.file)
         return "No file"
     file_url.short_description = 'File URL'
 
@@ -161,12 +288,17 @@ class DicomFileAdmin(admin.ModelAdmin):
 @admin.register(ProcessedHeatmap)
 class ProcessedHeatmapAdmin(admin.ModelAdmin):
     list_display = ['case_request', 'disease_name', 'model_version', 'heatmap_image', 'width', 'height', 'file_size', 'created_at']
-    list_filter = ['disease_name', 'model_version', 'created_at']
+    list_filter = ['disease_name', 'model_version', ('created_at', admin.DateFieldListFilter)]
+    date_hierarchy = 'created_at'
     search_fields = ['case_request__request_id', 'disease_name']
     readonly_fields = ['created_at', 'updated_at', 'heatmap_image_url']
+    list_select_related = ['case_request']
+    list_per_page = 50
+    show_full_result_count = False
+    autocomplete_fields = ['case_request']
 
     def heatmap_image_url(self, obj):
         if obj.heatmap_image:
-            return obj.heatmap_image.url
+            return media_url(obj.heatmap_image)
         return "No heatmap image"
     heatmap_image_url.short_description = 'Heatmap Image URL'
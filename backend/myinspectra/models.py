@@ -1,6 +1,71 @@
+from django.core.cache import cache
 from django.db import models
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image
+import os
+import string
+import time
 import uuid
 
+# Cache entry holding the ids of the profiles an upload runs (see views.find_upload_profiles)
+UPLOAD_PROFILES_CACHE_KEY = 'upload_profile_ids'
+
+# Upload-path slug: lowercase ASCII and spaces -> underscores in a single translate pass
+_SLUG_TABLE = str.maketrans(string.ascii_uppercase + ' ', string.ascii_lowercase + '_')
+
+
+def name_slug(name):
+    """Slugify a disease/class name for use in upload paths"""
+    if name.isascii():
+        return name.translate(_SLUG_TABLE)
+    return name.lower().replace(' ', '_')
+
+
+def uuid7():
+    """Time-ordered UUIDv7 (RFC 9562) so new rows append to the right edge of the index"""
+    timestamp_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10))
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76                         # version
+    value |= (rand >> 62 & 0xFFF) << 64        # rand_a
+    value |= 0b10 << 62                        # variant
+    value |= rand & 0x3FFF_FFFF_FFFF_FFFF      # rand_b
+    return uuid.UUID(int=value)
+
+
+def parse_thresholded_percentage(value):
+    """
+    Parse a thresholded label like '80%' to 80. Non-numeric labels ('Low', '12.5%') and values outside
+    0..100 give None, so an odd label can't overflow the PositiveSmallIntegerField and fail a bulk upsert.
+    """
+    try:
+        value = int(value.rstrip('%'))
+    except (AttributeError, ValueError):
+        return None
+    return value if 0 <= value <= 100 else None
+
+
+def fill_image_metadata(instance, field_file):
+    """Populate missing width/height/file_size with a single Pillow header read"""
+    if not field_file:
+        return
+    try:
+        if instance.width is None or instance.height is None:
+            # Reading a stored file opens a storage handle; close it again unless the caller had it open
+            opened_here = field_file.closed
+            with Image.open(field_file) as img:
+                instance.width, instance.height = img.size
+            if opened_here:
+                field_file.close()
+            else:
+                field_file.seek(0)
+        if instance.file_size is None:
+            instance.file_size = field_file.size
+    except (OSError, ValueError):
+        pass
+
 
 def raw_image_upload_path(instance, filename):
     return f'raw_images/{filename}'
@@ -8,14 +73,14 @@ def raw_image_upload_path(instance, filename):
 
 def heatmap_upload_path(instance, filename):
     """Generate upload path for heatmap images"""
-    case_id = instance.prediction.case_request.request_id
-    disease_slug = instance.prediction.disease_name.lower().replace(' ', '_')
+    case_id = instance.get_case_request().request_id
+    disease_slug = name_slug(instance.prediction.disease_name)
     return f'heatmaps/{case_id}/{disease_slug}_{filename}'
 
 def segment_upload_path(instance, filename):
     """Generate upload path for segment images"""
     case_id = instance.case_request.request_id
-    disease_slug = instance.class_name.lower().replace(' ', '_')
+    disease_slug = name_slug(instance.class_name)
     return f'segments/{case_id}/{disease_slug}_{filename}'
 
 
@@ -56,6 +121,9 @@ class CXRModel(models.Model):
     
     class Meta:
         unique_together = ['name', 'version', 'service_type']
+        indexes = [
+            models.Index(fields=['is_active', 'service_type']),
+        ]
     
     def __str__(self):
         return f"{self.get_service_type_display()} - {self.name} ({self.version})"
@@ -66,6 +134,7 @@ class PredictionProfile(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     cxr_models = models.ManyToManyField(CXRModel, related_name='profiles')
+    api_timeout = models.PositiveIntegerField(default=45, help_text="Seconds to wait for all of the profile's prediction APIs before continuing with partial results")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -74,21 +143,56 @@ class PredictionProfile(models.Model):
         return self.name
 
 
+# The views cache each profile's model URLs keyed by updated_at, so touching the
+# profile invalidates that cache in every worker process
+@receiver(post_save, sender=CXRModel)
+@receiver(pre_delete, sender=CXRModel)
+def touch_profiles_of_model(sender, instance, **kwargs):
+    PredictionProfile.objects.filter(cxr_models=instance).update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=PredictionProfile.cxr_models.through)
+def touch_profiles_on_models_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        profiles = PredictionProfile.objects.filter(pk=instance.pk)
+    elif pk_set is not None:
+        profiles = PredictionProfile.objects.filter(pk__in=pk_set)
+    else:
+        profiles = PredictionProfile.objects.filter(cxr_models=instance)
+    profiles.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=PredictionProfile)
+@receiver(post_delete, sender=PredictionProfile)
+def forget_upload_profiles(sender, **kwargs):
+    # A rename, (de)activation or new profile can change which profiles an upload picks
+    cache.delete(UPLOAD_PROFILES_CACHE_KEY)
+
+
 class CaseRequest(models.Model):
     """Store case request data for X-ray analysis"""
 
-    request_id = models.UUIDField(default=uuid.uuid4, editable=False, db_index=True)
+    request_id = models.UUIDField(default=uuid7, editable=False, unique=True)
     # profile field removed
     model_version = models.ForeignKey(CXRModel, on_delete=models.SET_NULL, null=True, blank=True, help_text="Legacy field")
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     success_upload = models.BooleanField(default=False, help_text="Indicates whether the image was uploaded successfully")
     success_process = models.BooleanField(default=False, help_text="Indicates whether the image was predicted successfully")
     success_response = models.BooleanField(default=False, help_text="Indicates whether the response was received successfully")
+    is_processing = models.BooleanField(default=False, help_text="Indicates whether the upload is still being processed in the background")
+    processing_started_at = models.DateTimeField(null=True, blank=True, editable=False, help_text="When the background job started processing the upload")
+    summary_json = models.JSONField(null=True, blank=True, editable=False, help_text="Case list v3/v4 summary, stored when processing finishes")
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Partial index matching the history list: uploaded cases, newest first
+            models.Index(fields=['-created_at'], condition=models.Q(success_upload=True), name='case_history_idx'),
+        ]
 
     def __str__(self):
         return str(self.request_id)
@@ -109,12 +213,16 @@ class RawImage(models.Model):
     original_filename = models.CharField(max_length=255, blank=True)
     content_type = models.CharField(max_length=100, blank=True)
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
 
+    def save(self, *args, **kwargs):
+        fill_image_metadata(self, self.image)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return str(self.case_request.request_id)
 
@@ -128,7 +236,7 @@ class DicomFile(models.Model):
     original_filename = models.CharField(max_length=255, blank=True)
     file_size = models.BigIntegerField(null=True, blank=True)
     
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
         return f"DICOM - {self.case_request.request_id}"
@@ -145,22 +253,55 @@ class Prediction(models.Model):
     prediction_value = models.FloatField(help_text="Raw prediction value from API")
     balanced_score = models.FloatField(help_text="Balanced score from API")
     thresholded_percentage = models.CharField(max_length=10, help_text="Thresholded percentage (e.g., '80%')")
+    thresholded_value = models.PositiveSmallIntegerField(null=True, blank=True, editable=False, help_text="Parsed thresholded_percentage; null when Low")
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
-        unique_together = ['case_request', 'disease_name', 'model_version']
+        constraints = [
+            models.UniqueConstraint(fields=['case_request', 'disease_name', 'model_version'], name='uniq_prediction_case_disease_version'),
+        ]
+        indexes = [
+            models.Index(fields=['disease_name', '-created_at']),
+            # Covering index (Postgres INCLUDE) so per-case score listings are index-only scans
+            models.Index(
+                fields=['case_request', 'model_version'],
+                include=['disease_name', 'prediction_value', 'balanced_score', 'thresholded_percentage', 'thresholded_value'],
+                name='prediction_case_covering_idx',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.thresholded_value = parse_thresholded_percentage(self.thresholded_percentage)
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if not adding:
+            # Keep the heatmap's denormalized case_request in step if this prediction was moved
+            Heatmap.objects.filter(prediction=self).exclude(case_request=self.case_request_id).update(case_request=self.case_request_id)
 
     def __str__(self):
         return f"{self.case_request.request_id} - {self.disease_name} ({self.model_version})"
 
 
+# A stored case summary is derived from its predictions; drop it when one changes so the
+# case list summarizes the case live (bulk writes during processing are followed by a fresh summary)
+@receiver(post_save, sender=Prediction)
+@receiver(post_delete, sender=Prediction)
+def forget_case_summary(sender, instance, origin=None, **kwargs):
+    # Deleting a case cascades here once per prediction; the case row is going too
+    if isinstance(origin, CaseRequest) or getattr(origin, 'model', None) is CaseRequest:
+        return
+    CaseRequest.objects.filter(pk=instance.case_request_id).update(summary_json=None)
+
+
 class Heatmap(models.Model):
     """Store heatmap images for disease predictions"""
 
     prediction = models.OneToOneField(Prediction, on_delete=models.CASCADE, related_name='heatmap')
+    # Denormalized from prediction.case_request so lookups by case skip the extra JOIN
+    case_request = models.ForeignKey(CaseRequest, on_delete=models.CASCADE, related_name='heatmaps', null=True, editable=False)
     heatmap_image = models.ImageField(upload_to=heatmap_upload_path)
 
     # Image metadata
@@ -168,14 +309,24 @@ class Heatmap(models.Model):
     height = models.IntegerField(null=True, blank=True)
     file_size = models.BigIntegerField(null=True, blank=True, help_text="Size in bytes")
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
 
+    def save(self, *args, **kwargs):
+        if self.case_request_id is None and self.prediction_id is not None:
+            self.case_request_id = self.prediction.case_request_id
+        fill_image_metadata(self, self.heatmap_image)
+        super().save(*args, **kwargs)
+
+    def get_case_request(self):
+        """The heatmap's case; rows saved before the denormalized FK existed only have it via the prediction."""
+        return self.case_request if self.case_request_id else self.prediction.case_request
+
     def __str__(self):
-        return f"{self.prediction.case_request.request_id}"
+        return f"{self.get_case_request().request_id}"
 
 
 class Segment(models.Model):
@@ -190,13 +341,23 @@ class Segment(models.Model):
     height = models.IntegerField(null=True, blank=True)
     file_size = models.BigIntegerField(null=True, blank=True, help_text="Size in bytes")
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['case_request', 'class_name', 'model_version'], name='uniq_segment_case_class_version'),
+        ]
+        indexes = [
+            models.Index(fields=['class_name', '-created_at']),
+        ]
     
+    def save(self, *args, **kwargs):
+        fill_image_metadata(self, self.segment_image)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.case_request.request_id} - {self.class_name} ({self.model_version})"
 
@@ -212,13 +373,17 @@ class OverlayHeatmap(models.Model):
     height = models.IntegerField(null=True, blank=True)
     file_size = models.BigIntegerField(null=True, blank=True, help_text="Size in bytes")
     
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
         unique_together = ['case_request', 'version']
 
+    def save(self, *args, **kwargs):
+        fill_image_metadata(self, self.overlay_image)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.case_request.request_id} - {self.version}"
 
@@ -226,7 +391,7 @@ class OverlayHeatmap(models.Model):
 def processed_heatmap_upload_path(instance, filename):
     """Generate upload path for processed heatmap overlay images"""
     case_id = instance.case_request.request_id
-    disease_slug = instance.disease_name.lower().replace(' ', '_')
+    disease_slug = name_slug(instance.disease_name)
     return f'processed_heatmaps/{case_id}/{instance.model_version}/{disease_slug}_{filename}'
 
 
@@ -246,12 +411,16 @@ class ProcessedHeatmap(models.Model):
     height = models.IntegerField(null=True, blank=True)
     file_size = models.BigIntegerField(null=True, blank=True)
     
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
         unique_together = ['case_request', 'disease_name', 'model_version']
 
+    def save(self, *args, **kwargs):
+        fill_image_metadata(self, self.heatmap_image)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.case_request.request_id} - {self.disease_name} ({self.model_version})"
@@ -1,3 +1,159 @@
-from django.test import TestCase
+import io
+import time
+import uuid
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase
+from PIL import Image
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian
+
+from .models import uuid7
+from .utils import convert_pixels, dcm_to_numpy, image_extension, peek_image_size, photometric_transform, png_size
+from .views import case_search_filter
+
+
+def encode_image(fmt, size=(37, 21), mode='RGB', **params):
+    buffer = io.BytesIO()
+    Image.new(mode, size).save(buffer, format=fmt, **params)
+    return buffer.getvalue()
+
+
+class PeekImageSizeTests(SimpleTestCase):
+    def assertSize(self, data, size=(37, 21)):
+        fp = io.BytesIO(data)
+        fp.seek(0)
+        self.assertEqual(peek_image_size(fp), size)
+        self.assertEqual(fp.tell(), 0)
+
+    def test_png(self):
+        data = encode_image('PNG')
+        self.assertSize(data)
+        self.assertEqual(png_size(data), (37, 21))
+        self.assertEqual(image_extension(data), '.png')
+
+    def test_jpeg(self):
+        data = encode_image('JPEG')
+        self.assertSize(data)
+        self.assertEqual(image_extension(data), '.jpg')
+
+    def test_progressive_jpeg_after_app_segments(self):
+        # JFIF APP0 plus EXIF APP1 before an SOF2 header
+        exif = Image.Exif()
+        exif[0x010F] = 'x' * 300
+        data = encode_image('JPEG', progressive=True, exif=exif)
+        self.assertIn(b'\xff\xc2', data)
+        self.assertSize(data)
+
+    def test_gif(self):
+        self.assertSize(encode_image('GIF', mode='L'))
+
+    def test_webp_lossy(self):
+        data = encode_image('WEBP', quality=80)
+        self.assertEqual(data[12:16], b'VP8 ')
+        self.assertSize(data)
+        self.assertEqual(image_extension(data), '.webp')
+
+    def test_webp_lossless(self):
+        data = encode_image('WEBP', lossless=True)
+        self.assertEqual(data[12:16], b'VP8L')
+        self.assertSize(data)
+
+    def test_webp_extended(self):
+        data = encode_image('WEBP', mode='RGBA', quality=80)
+        self.assertEqual(data[12:16], b'VP8X')
+        self.assertSize(data)
+
+    def test_truncated_headers(self):
+        jpeg = encode_image('JPEG', progressive=True)
+        sof_end = jpeg.index(b'\xff\xc2') + 9
+        cases = (
+            ('PNG', encode_image('PNG'), 24),
+            ('JPEG', jpeg, sof_end),
+            ('GIF', encode_image('GIF', mode='L'), 10),
+            ('WEBP', encode_image('WEBP', quality=80), 30),
+            ('WEBP lossless', encode_image('WEBP', lossless=True), 30),
+        )
+        for fmt, data, header_end in cases:
+            # Every cut that ends before the size field is complete
+            for length in range(header_end):
+                with self.subTest(fmt=fmt, length=length):
+                    self.assertIsNone(peek_image_size(io.BytesIO(data[:length])))
+
+    def test_garbage(self):
+        for data in (b'', b'not an image at all', bytes(range(256)), b'\xff\xd8\x00\x00'):
+            with self.subTest(data=data[:8]):
+                self.assertIsNone(peek_image_size(io.BytesIO(data)))
+                self.assertIsNone(png_size(data))
+        self.assertIsNone(image_extension(b'GIF89a'))
+
+
+class UUID7Tests(SimpleTestCase):
+    def test_version_and_variant(self):
+        value = uuid7()
+        self.assertEqual(value.version, 7)
+        self.assertEqual(value.int >> 62 & 0b11, 0b10)
+
+    def test_timestamp(self):
+        before = time.time_ns() // 1_000_000
+        value = uuid7()
+        after = time.time_ns() // 1_000_000
+        self.assertTrue(before <= value.int >> 80 <= after)
+
+    def test_ordered_across_milliseconds(self):
+        values = []
+        for _ in range(5):
+            values.append(uuid7())
+            time.sleep(0.002)
+        self.assertEqual(values, sorted(values))
+        self.assertEqual(len({value.int & ((1 << 62) - 1) for value in values}), 5)
+
+
+class CaseSearchFilterTests(SimpleTestCase):
+    def test_full_request_id_is_exact(self):
+        value = uuid7()
+        self.assertEqual(case_search_filter(str(value)), {'request_id': value})
+        self.assertEqual(case_search_filter(str(value).upper()), {'request_id': value})
+
+    def test_other_uuid_forms_stay_partial(self):
+        value = uuid.UUID('01a13fa8-8216-7914-ae60-e81885985a65')
+        for search in (value.hex, f'{{{value}}}', value.urn):
+            with self.subTest(search=search):
+                self.assertEqual(case_search_filter(search), {'request_id__icontains': search})
+
+    def test_fragment_is_partial(self):
+        self.assertEqual(case_search_filter('01a13fa8'), {'request_id__icontains': '01a13fa8'})
+
+
+class Uint8LutTests(SimpleTestCase):
+    def make_dataset(self, **attrs):
+        rng = np.random.default_rng(0)
+        pixels = rng.integers(10, 240, size=(64, 48), dtype=np.uint8)
+        ds = Dataset()
+        ds.file_meta = FileMetaDataset()
+        ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds.Rows, ds.Columns = pixels.shape
+        ds.SamplesPerPixel = 1
+        ds.BitsAllocated = ds.BitsStored = 8
+        ds.HighBit = 7
+        ds.PixelRepresentation = 0
+        ds.PixelData = pixels.tobytes()
+        for name, value in attrs.items():
+            setattr(ds, name, value)
+        return ds
+
+    def assertMatchesArithmetic(self, ds, do_rescale, do_window):
+        photometric = ds.PhotometricInterpretation
+        expected = convert_pixels(
+            ds, ds.pixel_array, photometric_transform(photometric), photometric, do_rescale, do_window, True
+        )
+        np.testing.assert_array_equal(dcm_to_numpy(ds), expected)
+
+    def test_monochrome1(self):
+        self.assertMatchesArithmetic(self.make_dataset(PhotometricInterpretation='MONOCHROME1'), False, False)
+
+    def test_monochrome1_rescaled_and_windowed(self):
+        ds = self.make_dataset(
+            PhotometricInterpretation='MONOCHROME1', RescaleSlope=2, RescaleIntercept=-30, WindowCenter=150, WindowWidth=200
+        )
+        self.assertMatchesArithmetic(ds, True, True)
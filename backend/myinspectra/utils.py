@@ -2,6 +2,7 @@ import cv2
 import os
 import pydicom
 import shutil
+import struct
 import numpy as np
 from pydicom.pixels import convert_color_space
 import tempfile
@@ -15,82 +16,320 @@ logger = logging.getLogger(__name__)
 pydicom.charset.python_encoding.update({'ISO_IR 196':'UTF-8'})
 pydicom.charset.python_encoding.update({'ISO IR 192':'UTF-8'})
 
+# dcm_to_numpy works through the image in row blocks of about this many float64 bytes,
+# small enough that each block stays in L2 between the rescale/window/normalize steps
+BLOCK_BYTES = 1 << 20
+
+# Chunk size used when copying storage files to local temp files
+COPY_CHUNK_SIZE = 1 << 20
+
 def check_dcm_keys(dataset, keys):
     """
     Check whether dicom metadata exists or not
     """
     return all([key in dataset.dir(key) for key in keys])
 
-def rescale_image(image, slope, intercept):
+def rescale_image(image, slope, intercept, out=None):
     """
     Rescale image to corresponding range using slope and intercept.
-    return: image (numpy ndarray of float 32)
+    return: image (numpy ndarray of float 32), written into `out` if given
     """
-    return image.astype(np.float32) * slope + intercept
+    # One float32 copy, then scale/shift in place instead of allocating per operator
+    if out is None:
+        out = image.astype(np.float32)
+    else:
+        out[...] = image
+    out *= slope
+    out += intercept
+    return out
+
+def _keep_color_space(image, photometric, inplace=False):
+    return image
+
+def _invert_monochrome(image, photometric, inplace=False, image_max=None):
+    # MONOCHROME1 -> MONOCHROME2; pass image_max when the caller already knows it
+    if image_max is None:
+        image_max = image.max()
+    return np.subtract(image_max, image, out=image if inplace else None)
+
+def _convert_to_rgb(image, photometric, inplace=False):
+    try:
+        return convert_color_space(image, photometric, 'RGB')
+    except Exception as e:
+        logger.warning(f"Could not convert color space: {e}")
+        return image
 
-def fix_photometric_interpretation(dataset, image):
+# Transform per PhotometricInterpretation of a pixel_array, looked up once per dataset.
+# pydicom >= 3 already returns YBR pixel data as RGB, so those entries keep the data as-is;
+# anything not listed goes through convert_color_space.
+PHOTOMETRIC_TRANSFORMS = {
+    'MONOCHROME1': _invert_monochrome,
+    'MONOCHROME2': _keep_color_space,
+    'RGB': _keep_color_space,
+    'YBR_FULL': _keep_color_space,
+    'YBR_FULL_422': _keep_color_space,
+    'YBR_PARTIAL_420': _keep_color_space,
+    'YBR_PARTIAL_422': _keep_color_space,
+    'YBR_ICT': _keep_color_space,
+    'YBR_RCT': _keep_color_space,
+}
+
+def photometric_transform(photometric):
     """
-    Fix color scheme: MONOCHROME1 -> MONOCHROME2, YBR -> RGB
+    Return the transform(image, photometric, inplace=False) for a PhotometricInterpretation.
     """
-    if dataset.PhotometricInterpretation == 'MONOCHROME1':
-        return image.max() - image
-    elif dataset.PhotometricInterpretation not in ['MONOCHROME2', 'RGB']:
-        # Attempt conversion, though mostly for YBR
-        try:
-            return convert_color_space(image, dataset.PhotometricInterpretation, 'RGB')
-        except Exception as e:
-            logger.warning(f"Could not convert color space: {e}")
-            return image
-    return image
+    if photometric is None:
+        return _keep_color_space
+    return PHOTOMETRIC_TRANSFORMS.get(photometric, _convert_to_rgb)
+
+def fix_photometric_interpretation(dataset, image, inplace=False):
+    """
+    Fix color scheme: MONOCHROME1 -> MONOCHROME2, other non-RGB color spaces -> RGB
+    With inplace=True the MONOCHROME1 inversion overwrites `image` instead of allocating.
+    """
+    photometric = dataset.PhotometricInterpretation
+    return photometric_transform(photometric)(image, photometric, inplace=inplace)
 
-def apply_window(image, center, width):
+def window_bounds(center, width):
     """
-    Apply windowing to image
+    Return the (min, max) values kept by a WindowCenter/WindowWidth pair.
     """
     if not isinstance(center, (int, float)):
         center = float(center) if hasattr(center, 'real') else center[0]
     if not isinstance(width, (int, float)):
         width = float(width) if hasattr(width, 'real') else width[0]
-        
-    image = image.copy()
-    min_value = center - width // 2
-    max_value = center + width // 2
-    image[image < min_value] = min_value
-    image[image > max_value] = max_value
-    return image
+    return center - width // 2, center + width // 2
+
+def apply_window(image, center, width, out=None):
+    """
+    Apply windowing to image.
+    Clips into `out` (pass `out=image` to clip in place); a new buffer is allocated if omitted.
+    """
+    min_value, max_value = window_bounds(center, width)
+    if out is None:
+        out = np.empty_like(image)
+    if image.dtype.kind in 'iu':
+        # Clamp to the dtype's range first: the 'unsafe' cast below would wrap an out-of-range bound
+        # (a negative minimum on uint16 becomes 65536 + min) instead of leaving that side unclipped
+        info = np.iinfo(image.dtype)
+        min_value = min(max(min_value, info.min), info.max)
+        max_value = min(max(max_value, info.min), info.max)
+    # 'unsafe' matches the previous masked assignment, which cast the bounds to the image dtype
+    return np.clip(image, min_value, max_value, out=out, casting='unsafe')
+
+def rescale_fits_float32(dataset, pixels, window=True):
+    """
+    Check whether rescaling (and windowing) integer pixels only ever produces integers
+    below 2**24, which float32 holds exactly, so float32 gives the same result as float64.
+    """
+    if pixels.dtype.kind not in 'iu' or pixels.dtype.itemsize > 2:
+        return False
+    slope, intercept = float(dataset.RescaleSlope), float(dataset.RescaleIntercept)
+    if not (slope.is_integer() and intercept.is_integer()):
+        return False
+    bound = abs(slope) * (1 << 16) + abs(intercept)
+    if window:
+        min_value, max_value = window_bounds(dataset.WindowCenter, dataset.WindowWidth)
+        if not (float(min_value).is_integer() and float(max_value).is_integer()):
+            return False
+        bound = max(bound, abs(min_value), abs(max_value))
+    return bound < (1 << 24)
+
+def row_blocks(shape):
+    """
+    Split axis 0 of an image into slices of roughly BLOCK_BYTES (as float64).
+    """
+    row_bytes = max(1, int(np.prod(shape[1:])) * 8)
+    step = max(1, BLOCK_BYTES // row_bytes)
+    return [slice(start, start + step) for start in range(0, shape[0], step)]
 
 def dcm_to_numpy(dataset, fix_color_scheme=True, window=True, normalize=True, rescale=True):
     """
     Convert dcm object to a numpy image (uint8).
+    Runs as two passes over cache-sized row blocks instead of one full-image pass per step;
+    8-bit data goes through a 256-entry lookup table instead.
     """
-    # 1. Rescale (Slope/Intercept)
-    if rescale and check_dcm_keys(dataset, ['RescaleSlope', 'RescaleIntercept']):
-        image_2d = rescale_image(dataset.pixel_array, dataset.RescaleSlope, dataset.RescaleIntercept)
+    pixels = dataset.pixel_array
+    do_rescale = rescale and check_dcm_keys(dataset, ['RescaleSlope', 'RescaleIntercept'])
+    do_window = window and check_dcm_keys(dataset, ['WindowCenter', 'WindowWidth'])
+    photometric = None
+    if fix_color_scheme and 'PhotometricInterpretation' in dataset:
+        photometric = dataset.PhotometricInterpretation
+    transform = photometric_transform(photometric)
+
+    if normalize and pixels.dtype == np.uint8 and transform in (_keep_color_space, _invert_monochrome):
+        # Every step is per value, and the darkest and brightest pixels are both among the values
+        # run through the pipeline here, so the normalize range and the result are unchanged
+        pmin, pmax = int(pixels.min()), int(pixels.max())
+        values = np.arange(pmin, pmax + 1, dtype=np.uint8)[np.newaxis, :]
+        lut = np.zeros(256, dtype=np.uint8)
+        lut[pmin:pmax + 1] = convert_pixels(dataset, values, transform, photometric, do_rescale, do_window, normalize)[0]
+        return cv2.LUT(np.ascontiguousarray(pixels).reshape(-1), lut).reshape(pixels.shape)
+
+    return convert_pixels(dataset, pixels, transform, photometric, do_rescale, do_window, normalize)
+
+def convert_pixels(dataset, pixels, transform, photometric, do_rescale, do_window, normalize):
+    """
+    Rescale, window, fix the colour scheme of and normalize `pixels` for dcm_to_numpy.
+    """
+    blocks = row_blocks(pixels.shape)
+
+    # 1-2. Rescale (Slope/Intercept) and apply windowing block by block, tracking the range.
+    # Only these steps need a writable copy; without them the blocks are read straight from
+    # pydicom's cached pixel_array, which is never written to.
+    owns_buffer = do_rescale or do_window
+    if do_rescale:
+        # Unnormalized output keeps the float64 values callers got before
+        if normalize and rescale_fits_float32(dataset, pixels, do_window):
+            work_dtype = np.float32
+        else:
+            work_dtype = np.result_type(np.float32, dataset.RescaleSlope, dataset.RescaleIntercept)
+        # pydicom's DS values are strong float64 scalars to NumPy and would push a float32 multiply
+        # through a float64 cast loop; plain floats have the same values and run in the buffer dtype
+        slope, intercept = float(dataset.RescaleSlope), float(dataset.RescaleIntercept)
     else:
-        # Fallback to copy to avoid modifying original if it is read-only
-        image_2d = dataset.pixel_array.copy()
-    
-    # 2. Apply Windowing
-    if window and check_dcm_keys(dataset, ['WindowCenter', 'WindowWidth']):
-        image_2d = apply_window(image_2d, dataset.WindowCenter, dataset.WindowWidth)
-    
+        work_dtype = pixels.dtype
+    image_2d = np.empty(pixels.shape, dtype=work_dtype) if owns_buffer else pixels
+    # The range is only used by normalize and the MONOCHROME1 inversion; both reductions
+    # run on the block while it is still in cache, so they cost no extra trip to memory
+    need_range = normalize or transform is _invert_monochrome
+    imin = imax = None
+    for rows in blocks:
+        block = image_2d[rows]
+        if do_rescale:
+            rescale_image(pixels[rows], slope, intercept, out=block)
+        elif owns_buffer:
+            block[...] = pixels[rows]
+        if do_window:
+            apply_window(block, dataset.WindowCenter, dataset.WindowWidth, out=block)
+        if not need_range:
+            continue
+        block_min, block_max = block.min(), block.max()
+        imin = block_min if imin is None else min(imin, block_min)
+        imax = block_max if imax is None else max(imax, block_max)
+
     # 3. Fix Photometric Interpretation (Color Space)
-    if fix_color_scheme and 'PhotometricInterpretation' in dataset:
-        image_2d = fix_photometric_interpretation(dataset, image_2d)
-    
+    invert_from = None
+    if transform is _invert_monochrome:
+        # max - image maps the range [imin, imax] onto [0, imax - imin]; the inversion
+        # itself is applied per block in the normalize pass below
+        invert_from, imin, imax = imax, imax - imax, imax - imin
+        if not normalize:
+            return transform(image_2d, photometric, inplace=owns_buffer, image_max=invert_from)
+    elif transform is not _keep_color_space:
+        image_2d = transform(image_2d, photometric, inplace=owns_buffer)
+        if normalize:
+            imin, imax = image_2d.min(), image_2d.max()
+
+    if not normalize:
+        return image_2d if image_2d is not pixels else pixels.copy()
+
     # 4. Normalize to 0-255 uint8
-    if normalize:
-        image_2d = image_2d.astype(float)
-        imin, imax = image_2d.min(), image_2d.max()
+    imin, imax = float(imin), float(imax)
+    output = np.empty(image_2d.shape, dtype=np.uint8)
+    # float32 halves the traffic and truncates to the same uint8 values whenever the image is integers
+    # it holds exactly: <= 16-bit integer pixels, unrescaled or rescaled under rescale_fits_float32.
+    # Float pixel data, float32 included, is normalized in float64 like the rest.
+    exact_in_float32 = pixels.dtype.kind in 'iu' and np.can_cast(image_2d.dtype, np.float32)
+    norm_dtype = np.float32 if exact_in_float32 else np.float64
+    scratch = np.empty(image_2d[blocks[0]].shape, dtype=norm_dtype)
+    for rows in blocks:
+        block = image_2d[rows]
+        work = scratch[:len(block)]
+        if invert_from is not None:
+            # Subtracts in the image dtype, then widens into the scratch buffer
+            np.subtract(invert_from, block, out=work)
+        else:
+            work[...] = block
         if imax > imin:
-            image_2d = (image_2d - imin) / (imax - imin)
+            work -= imin
+            work /= (imax - imin)
         else:
-            image_2d = np.zeros_like(image_2d) # Avoid div by zero
-            
-        image_2d = (image_2d * 255.0)
-        image_2d = np.uint8(image_2d)
-        
-    return image_2d
+            work.fill(0) # Avoid div by zero
+        work *= 255.0
+        output[rows] = work
+
+    return output
+
+# JPEG start-of-frame markers carrying the image size (SOF0-SOF15 minus DHT, JPG and DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def _jpeg_size(fp):
+    """
+    Walk JPEG marker segments (fp positioned just after SOI) until a SOFn header.
+    """
+    while True:
+        marker = fp.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        while code == 0xFF:
+            # Fill bytes before the marker code
+            byte = fp.read(1)
+            if not byte:
+                return None
+            code = byte[0]
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue # Standalone markers have no length field
+        length = fp.read(2)
+        if len(length) < 2:
+            return None
+        if code in JPEG_SOF_MARKERS:
+            header = fp.read(5)
+            if len(header) < 5:
+                return None
+            height, width = struct.unpack('>HH', header[1:5])
+            return width, height
+        fp.seek(struct.unpack('>H', length)[0] - 2, os.SEEK_CUR)
+
+def png_size(data):
+    """
+    Read (width, height) from the IHDR chunk of PNG bytes. Returns None if `data` is not a PNG.
+    """
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR' and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+    return None
+
+def image_extension(data):
+    """
+    File extension for PNG, JPEG or WebP bytes, judged by their signature. Returns None for anything else.
+    """
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return '.png'
+    if data[:2] == b'\xff\xd8':
+        return '.jpg'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+def peek_image_size(fp):
+    """
+    Read (width, height) from the header of a PNG, JPEG, GIF or WebP file without decoding it.
+    The file position is restored afterwards. Returns None for other formats or a truncated header.
+    """
+    start = fp.tell()
+    try:
+        head = fp.read(32)
+        if head.startswith(b'\x89PNG'):
+            return png_size(head)
+        if head.startswith(b'\xff\xd8'):
+            fp.seek(start + 2)
+            return _jpeg_size(fp)
+        if head[:6] in (b'GIF87a', b'GIF89a') and len(head) >= 10:
+            return struct.unpack('<HH', head[6:10])
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP' and len(head) >= 30:
+            chunk = head[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', head[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b'VP8L':
+                bits = int.from_bytes(head[21:25], 'little')
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b'VP8X':
+                return int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1
+        return None
+    finally:
+        fp.seek(start)
 
 def convert_dicom_to_image(dicom_input):
     """
@@ -119,6 +358,25 @@ class TempFileManager:
     """Helper class to manage downloading S3 files to temporary local files."""
     def __init__(self):
         self.temp_files = []
+        # storage name -> local temp path, from keep_local_copy or an earlier download
+        self.local_copies = {}
+
+    def keep_local_copy(self, django_file, data):
+        """
+        Keep bytes that were just written to storage in a local temp file,
+        so a later get_path() for the same file doesn't download it again.
+        Does nothing for storages that already have local paths.
+        """
+        try:
+            django_file.path
+            return
+        except NotImplementedError:
+            pass
+        ext = os.path.splitext(django_file.name)[1]
+        with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tf:
+            tf.write(data)
+        self.temp_files.append(tf.name)
+        self.local_copies[django_file.name] = tf.name
 
     def get_path(self, django_file):
         """
@@ -132,6 +390,8 @@ class TempFileManager:
             return django_file.path
         except NotImplementedError:
             # S3 or other storage that doesn't support .path
+            if django_file.name in self.local_copies:
+                return self.local_copies[django_file.name]
             # Download to temp file
             try:
                 # Use suffix from name if available
@@ -139,13 +399,16 @@ class TempFileManager:
                 # Create temp file; delete=False so we can close and use it
                 tf = tempfile.NamedTemporaryFile(suffix=ext, delete=False)
                 
-                # Read content and write to temp
+                # Stream content to temp in 1MB chunks instead of holding the whole object in memory
                 django_file.open('rb') # Ensure open
-                tf.write(django_file.read())
-                django_file.close() # Good practice to close
-                tf.close()
+                try:
+                    shutil.copyfileobj(django_file, tf, length=COPY_CHUNK_SIZE)
+                finally:
+                    django_file.close() # Good practice to close
+                    tf.close()
                 
                 self.temp_files.append(tf.name)
+                self.local_copies[django_file.name] = tf.name
                 return tf.name
             except Exception as e:
                 logger.error(f"Error creating temp file for {django_file.name}: {e}")
@@ -155,6 +418,21 @@ class TempFileManager:
                      except: pass
                 raise
 
+    def prefetch(self, django_files, executor):
+        """
+        Download several files concurrently on `executor` so later get_path() calls are lookups.
+        Failures are left for the later get_path() call to raise.
+        """
+        pending = {}
+        for django_file in django_files:
+            if django_file and django_file.name not in pending:
+                pending[django_file.name] = executor.submit(self.get_path, django_file)
+        for future in pending.values():
+            try:
+                future.result()
+            except Exception:
+                pass
+
     def cleanup(self):
         """Remove all temporary files created."""
         for path in self.temp_files:
@@ -1,20 +1,37 @@
 from django.shortcuts import render
 from django.http import HttpResponse, JsonResponse
+from django.core.files import File
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
 import json
 import io
 import concurrent.futures
+import functools
+import hashlib
+import threading
 from .models import RawImage, CaseRequest, CXRModel, Prediction, Heatmap, Segment, OverlayHeatmap, PredictionProfile, DicomFile, ProcessedHeatmap
+from .models import UPLOAD_PROFILES_CACHE_KEY, parse_thresholded_percentage
 from .heatmap_orchestrate.main import HeatmapOverlayProcessor
 from .heatmap_orchestrate.config import HeatmapConfig, InspectraImageOverlayConfig
-from .utils import TempFileManager, convert_dicom_to_image
+from .utils import TempFileManager, convert_dicom_to_image, image_extension, peek_image_size
 import os
 import requests
-import base64
+from requests.adapters import HTTPAdapter
+from urllib3 import encode_multipart_formdata
+from urllib3.util.retry import Retry
+from botocore.exceptions import ClientError
+import binascii
+import cv2
 import tempfile
+import uuid
 from PIL import Image
 
 import logging
@@ -30,6 +47,18 @@ ALLOWED_IMAGE_TYPES = {'image/png', 'image/jpeg', 'image/jpg'}
 ALLOWED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.dcm'}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
 
+# zlib level for PNGs written with Pillow; level 1 encodes a CXR-sized image ~6x faster than
+# the default for ~15% more bytes (PNG is lossless at every level)
+PNG_COMPRESS_LEVEL = 1
+
+# How long a profile's active model URLs are cached; admin edits invalidate the entry right away
+# by bumping PredictionProfile.updated_at, which is part of the cache key
+PROFILE_URLS_CACHE_TIMEOUT = 3600
+
+# How long the ids of the v3.5.1/v4.5.0 upload profiles are cached. Saving or deleting a profile
+# clears the entry; the rows themselves are re-read on every upload, so only the choice can go stale
+UPLOAD_PROFILES_CACHE_TIMEOUT = 300
+
 def api_error_response(message: str, status: int = 400, details: dict = None) -> JsonResponse:
     """Standardized error response for API endpoints."""
     response_data = {'error': message}
@@ -51,98 +80,437 @@ def validate_uploaded_file(file) -> tuple[bool, str]:
     if ext not in ALLOWED_EXTENSIONS:
         return False, f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
     
+    # Check the signature of images from their first bytes only, before anything is stored or sent.
+    # DICOMs are left to pydicom, which also reads files without the DICM preamble.
+    if ext != '.dcm':
+        head = file.read(16)
+        file.seek(0)
+        if image_extension(head) not in ('.png', '.jpg'):
+            return False, "File content is not a PNG or JPEG image"
+    
     return True, ""
 
-def call_prediction_api(url, file_data, filename, content_type, data):
-    files = {'file': (filename, file_data, content_type)}
+def make_http_session(retries=2):
+    """
+    Shared session for the prediction services so connections are kept alive between calls.
+    Retries connect failures and 502/503/504 gateway errors only; results are upserted by request_id,
+    so re-sending a POST there is safe. Read timeouts and errors after the body was sent are not retried:
+    the service may still be running the inference, and a retry would outlast the caller's deadline.
+    Pass retries=0 for calls made inside a request, where a retried gateway error could outlast gunicorn's timeout.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=50,
+        max_retries=Retry(
+            total=retries,
+            read=False,
+            other=0,
+            backoff_factor=0.1,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=None,
+            raise_on_status=False,
+        ),
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+http_session = make_http_session()
+# v5 runs inside the request: a single attempt (3s connect + 60s read) stays under gunicorn's 120s timeout
+v5_http_session = make_http_session(retries=0)
+
+# (connect, read): fail fast when a model service is down, but allow slow inference
+PREDICTION_TIMEOUT = (3, 30)
+# The v5 service also renders the overlay, so it gets a longer read timeout
+V5_TIMEOUT = (3, 60)
+
+# Makes the prediction service calls for all requests; sized for a few uploads' worth of
+# concurrent calls (each upload makes one call per distinct model URL). Kept apart from
+# prediction_executor: a call past its upload's budget can't be cancelled and holds its thread
+# until the HTTP timeout, which must not stall other uploads' storage writes.
+API_CALL_MAX_WORKERS = 16
+api_call_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=API_CALL_MAX_WORKERS, thread_name_prefix='api-call'
+)
+
+# Shared by all requests so worker threads are reused; runs the heatmap, segment and
+# processed-heatmap storage writes and the processor's prefetch downloads
+PREDICTION_MAX_WORKERS = 16
+prediction_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=PREDICTION_MAX_WORKERS, thread_name_prefix='prediction'
+)
+
+# Runs one of an upload's profile workflows alongside the other. Kept separate from
+# prediction_executor because workflows wait on tasks they submit there.
+WORKFLOW_MAX_WORKERS = 8
+workflow_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=WORKFLOW_MAX_WORKERS, thread_name_prefix='workflow'
+)
+
+# Processes uploads after api_upload has responded, so a web worker isn't held for the whole
+# inference. Separate from workflow_executor because each upload waits on a workflow submitted there.
+UPLOAD_MAX_WORKERS = 4
+upload_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=UPLOAD_MAX_WORKERS, thread_name_prefix='upload'
+)
+# Every queued upload holds its image in memory, so api_upload answers 503 once this many
+# are running or waiting instead of letting the executor's queue grow without bound
+UPLOAD_QUEUE_LIMIT = UPLOAD_MAX_WORKERS * 2
+upload_slots = threading.BoundedSemaphore(UPLOAD_QUEUE_LIMIT)
+
+# A deploy or restart kills in-process uploads before they clear is_processing. A case is failed
+# once its job has run longer than MAX_PROCESSING_TIME (the API budget plus heatmaps, with margin),
+# or has not started within MAX_QUEUE_TIME (the jobs ahead of it in a full queue)
+MAX_PROCESSING_TIME = timedelta(minutes=10)
+MAX_QUEUE_TIME = MAX_PROCESSING_TIME * (UPLOAD_QUEUE_LIMIT // UPLOAD_MAX_WORKERS)
+
+def fail_stuck_uploads(cases):
+    """
+    Mark uploads in `cases` whose background job was lost as failed, clearing is_processing.
+    Returns the number of cases updated.
+    """
+    now = timezone.now()
+    return cases.filter(is_processing=True).filter(
+        Q(processing_started_at__lt=now - MAX_PROCESSING_TIME)
+        | Q(processing_started_at__isnull=True, created_at__lt=now - MAX_QUEUE_TIME)
+    ).update(is_processing=False, success_process=False, updated_at=now)
+
+def encode_prediction_form(file_data, filename, content_type, data):
+    """
+    Build the multipart body sent to the prediction services.
+    Encoded once per upload and shared by every call instead of letting requests rebuild it per URL.
+
+    Returns: (body, multipart content type)
+    """
+    fields = list(data.items())
+    fields.append(('file', (filename, file_data, content_type)))
+    return encode_multipart_formdata(fields)
+
+def call_prediction_api(url, body, form_content_type):
     try:
-        response = requests.post(url, files=files, data=data, timeout=30)
+        response = http_session.post(
+            url, data=body, headers={'Content-Type': form_content_type}, timeout=PREDICTION_TIMEOUT
+        )
         response.raise_for_status()
         return response.json()
     except Exception as e:
         logger.error(f"Error calling {url}: {e}")
         return {'error': str(e)}
 
-def save_heatmap(prediction, heatmap_b64, model_version='v4.5.0'):
+def decode_image_payload(b64_data):
+    """
+    Decode a base64 image from a prediction API.
+    PNG, JPEG and WebP payloads are kept as sent, sized from their header; anything else is re-encoded as PNG.
+    Returns: (image_bytes, extension, width, height)
+    """
+    # a2b_base64 takes the ASCII str as-is; b64decode would first copy it to bytes
+    data = binascii.a2b_base64(b64_data)
+    extension = image_extension(data)
+    size = peek_image_size(io.BytesIO(data)) if extension else None
+    if size:
+        return data, extension, size[0], size[1]
+    img_buffer = io.BytesIO()
+    with Image.open(io.BytesIO(data)) as image:
+        image.save(img_buffer, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
+        return img_buffer.getvalue(), '.png', image.width, image.height
+
+class StorageWrites:
+    """
+    Names of files written to storage for rows that a transaction.atomic() block has not committed yet.
+    Enter it outside the atomic block: if the block raises, its rows are rolled back and the files
+    are deleted so they aren't left unreferenced in the bucket. `pending` are futures that may
+    still be writing files for the block; they are waited for first.
+    """
+    def __init__(self, pending=()):
+        self.names = []
+        self.pending = pending
+
+    def add(self, field_file):
+        if field_file.name not in self.names:
+            self.names.append(field_file.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            return False
+        concurrent.futures.wait(self.pending)
+        for name in self.names:
+            try:
+                default_storage.delete(name)
+            except Exception as e:
+                logger.warning(f"Could not delete {name} after rollback: {e}")
+        return False
+
+def build_heatmap(prediction, heatmap_b64, model_version='v4.5.0', temp_manager=None, stored=None):
+    """
+    Decode a heatmap and write its file to storage.
+    Returns an unsaved Heatmap for bulk upsert, or None if there is no usable image.
+    """
     if not heatmap_b64:
-        return
+        return None
     try:
-        heatmap_data = base64.b64decode(heatmap_b64)
-        heatmap_image = Image.open(io.BytesIO(heatmap_data))
-        
-        img_buffer = io.BytesIO()
-        heatmap_image.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
+        heatmap_data, extension, width, height = decode_image_payload(heatmap_b64)
         
-        heatmap, _ = Heatmap.objects.update_or_create(
+        heatmap = Heatmap(
             prediction=prediction,
-            defaults={
-                'width': heatmap_image.width,
-                'height': heatmap_image.height,
-                'file_size': len(heatmap_data),
-            }
+            case_request=prediction.case_request,
+            width=width,
+            height=height,
+            file_size=len(heatmap_data),
         )
         # Include version as subdirectory to prevent overwriting
-        filename = f"heatmaps/{model_version}/heatmap.png"
-        heatmap.heatmap_image.save(filename, ContentFile(img_buffer.getvalue()), save=True)
+        filename = f"heatmaps/{model_version}/heatmap{extension}"
+        heatmap.heatmap_image.save(filename, ContentFile(heatmap_data), save=False)
+        if stored is not None:
+            stored.add(heatmap.heatmap_image)
+        if temp_manager:
+            temp_manager.keep_local_copy(heatmap.heatmap_image, heatmap_data)
+        return heatmap
     except Exception as e:
         logger.error(f"Error saving heatmap: {e}")
+        return None
 
-def process_prediction_result(case_request, result_data, model_version):
+def build_segment(case_request, class_name, segment_b64, model_version, temp_manager=None, stored=None):
+    """
+    Decode a segment mask and write its file to storage.
+    Returns an unsaved Segment for bulk upsert, or None if the payload is unusable.
+    """
+    try:
+        segment_data, extension, width, height = decode_image_payload(segment_b64)
+        
+        segment = Segment(
+            case_request=case_request,
+            class_name=class_name,
+            model_version=model_version,
+            width=width,
+            height=height,
+            file_size=len(segment_data),
+        )
+        # Include version as subdirectory to prevent overwriting
+        safe_class_name = class_name.replace(' ', '_').lower()
+        filename = f"segments/{model_version}/{safe_class_name}_segment{extension}"
+        segment.segment_image.save(filename, ContentFile(segment_data), save=False)
+        if stored is not None:
+            stored.add(segment.segment_image)
+        if temp_manager:
+            temp_manager.keep_local_copy(segment.segment_image, segment_data)
+        return segment
+    except Exception as e:
+        logger.error(f"Error saving segment for {class_name}: {e}")
+        return None
+
+def build_processed_heatmap(case_request, disease_name, overlay_img, model_version, stored=None):
+    """
+    Encode one of the processor's individual overlays and write it to storage.
+    Returns an unsaved ProcessedHeatmap for bulk upsert, or None if it can't be encoded.
+    """
+    try:
+        success, encoded_img = cv2.imencode('.png', overlay_img)
+        if not success:
+            return None
+        img_content = encoded_img.tobytes()
+        processed_heatmap = ProcessedHeatmap(
+            case_request=case_request,
+            disease_name=disease_name,
+            model_version=model_version,
+            width=overlay_img.shape[1],
+            height=overlay_img.shape[0],
+            file_size=len(img_content),
+        )
+        safe_disease_name = disease_name.lower().replace(' ', '_')
+        processed_heatmap.heatmap_image.save(f"{safe_disease_name}_overlay.png", ContentFile(img_content), save=False)
+        if stored is not None:
+            stored.add(processed_heatmap.heatmap_image)
+        return processed_heatmap
+    except Exception as e:
+        logger.warning(f"Failed to save individual heatmap for {disease_name}: {e}")
+        return None
+
+def process_prediction_result(case_request, result_data, model_version, temp_manager=None, stored=None):
     if not result_data:
         return
+    predictions = []
     for disease, values in result_data.items():
-        prediction, _ = Prediction.objects.update_or_create(
+        thresholded = values.get('thresholded', '0%')
+        predictions.append(Prediction(
             case_request=case_request,
             disease_name=disease,
             model_version=model_version,
-            defaults={
-                'prediction_value': values.get('prediction', 0.0),
-                'balanced_score': values.get('balanced_score', 0.0),
-                'thresholded_percentage': values.get('thresholded', '0%'),
-            }
-        )
-        save_heatmap(prediction, values.get('heatmap', ''), model_version)
+            prediction_value=values.get('prediction', 0.0),
+            balanced_score=values.get('balanced_score', 0.0),
+            thresholded_percentage=thresholded,
+            thresholded_value=parse_thresholded_percentage(thresholded),
+        ))
+    # Single upsert for all diseases; PKs are returned so heatmaps can reference them
+    Prediction.objects.bulk_create(
+        predictions,
+        update_conflicts=True,
+        unique_fields=['case_request', 'disease_name', 'model_version'],
+        update_fields=['prediction_value', 'balanced_score', 'thresholded_percentage', 'thresholded_value', 'updated_at'],
+    )
+    # Storage writes run on the shared pool; rows are still written here, inside the caller's transaction
+    futures = [
+        prediction_executor.submit(build_heatmap, prediction, values.get('heatmap', ''), model_version, temp_manager, stored)
+        for prediction, values in zip(predictions, result_data.values())
+    ]
+    heatmaps = [heatmap for heatmap in (future.result() for future in futures) if heatmap]
+    # Files are already in storage; one upsert writes every heatmap row
+    Heatmap.objects.bulk_create(
+        heatmaps,
+        update_conflicts=True,
+        unique_fields=['prediction'],
+        update_fields=['case_request', 'heatmap_image', 'width', 'height', 'file_size', 'updated_at'],
+    )
 
-def process_segmentation_result(case_request, result_data, model_version):
+def process_segmentation_result(case_request, result_data, model_version, temp_manager=None, stored=None):
     if not result_data or 'heatmap' not in result_data:
         return
 
-    for class_name, segment_b64 in result_data['heatmap'].items():
-        if not segment_b64:
-            continue
+    futures = [
+        prediction_executor.submit(build_segment, case_request, class_name, segment_b64, model_version, temp_manager, stored)
+        for class_name, segment_b64 in result_data['heatmap'].items()
+        if segment_b64
+    ]
+    segments = [segment for segment in (future.result() for future in futures) if segment]
+
+    Segment.objects.bulk_create(
+        segments,
+        update_conflicts=True,
+        unique_fields=['case_request', 'class_name', 'model_version'],
+        update_fields=['segment_image', 'width', 'height', 'file_size', 'updated_at'],
+    )
+
+
+
+HEATMAP_CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'heatmap_orchestrate', 'configs')
+
+@functools.cache
+def load_heatmap_configs(version_key):
+    """
+    Parse a version's heatmap and overlay configs once per process instead of on every upload.
+    The processor itself is still built per request.
+    """
+    if version_key == "v4.5.0":
+        config_path = os.path.join(HEATMAP_CONFIG_DIR, 'config_v4.yml')
+        overlay_config_path = os.path.join(HEATMAP_CONFIG_DIR, 'overlay_config_v4.yml')
+    else:
+        config_path = os.path.join(HEATMAP_CONFIG_DIR, 'config.yml')
+        overlay_config_path = os.path.join(HEATMAP_CONFIG_DIR, 'overlay_config.yml')
+    return HeatmapConfig(config_path), InspectraImageOverlayConfig(overlay_config_path)
+
+
+# Service type -> handler that saves its result; predictions are saved before segments
+RESULT_HANDLERS = {
+    'abnormality': process_prediction_result,
+    'tuberculosis': process_prediction_result,
+    'pneumothorax': process_prediction_result,
+    'lung_segmentation': process_segmentation_result,
+    'pleural_effusion_segmentation': process_segmentation_result,
+    'pneumothorax_segmentation': process_segmentation_result,
+}
+
+
+def profile_version_key(profile):
+    """Model version stored on Predictions/Segments/Overlays for a profile."""
+    if "v4.5.0" in profile.name:
+        return "v4.5.0"
+    return "v3.5.1"
+
+
+def get_profile_api_urls(profile):
+    """Active {service_type: api_url} for a profile, cached to skip the M2M query on every upload."""
+    return cache.get_or_set(
+        f"profile_api_urls:{profile.pk}:{profile.updated_at.timestamp()}",
+        lambda: {model.service_type: model.api_url for model in profile.cxr_models.filter(is_active=True)},
+        PROFILE_URLS_CACHE_TIMEOUT,
+    )
+
+
+def find_upload_profiles():
+    """
+    The active (v3.5.1, v4.5.0) profiles an upload runs; either is None if missing.
+    The matched ids are cached so an upload fetches both rows in one query instead of searching by name.
+    """
+    ids = cache.get(UPLOAD_PROFILES_CACHE_KEY)
+    if ids:
+        profiles = PredictionProfile.objects.filter(is_active=True).in_bulk(ids)
+        if all(pk in profiles for pk in ids):
+            return tuple(profiles[pk] for pk in ids)
+
+    profile_v3 = PredictionProfile.objects.filter(name__icontains="v3.5.1", is_active=True).first()
+    profile_v4 = PredictionProfile.objects.filter(name__icontains="v4.5.0", is_active=True).first()
+
+    if not profile_v3 or not profile_v4:
+        # Fallback search if exact names not found
+        profiles = PredictionProfile.objects.filter(is_active=True)
+        for p in profiles:
+            if "v3" in p.name and not profile_v3: profile_v3 = p
+            if "v4" in p.name and not profile_v4: profile_v4 = p
+
+    if profile_v3 and profile_v4:
+        cache.set(UPLOAD_PROFILES_CACHE_KEY, (profile_v3.pk, profile_v4.pk), UPLOAD_PROFILES_CACHE_TIMEOUT)
+    return profile_v3, profile_v4
+
+
+def call_profile_apis(case_request, profiles, file_data, filename, content_type):
+    """
+    Call the prediction APIs of several profiles concurrently.
+    Each distinct URL is requested once even if more than one profile uses it.
+
+    Returns: {profile.pk: (results, errors)}
+    """
+    body, form_content_type = encode_prediction_form(
+        file_data, filename, content_type, {'request_id': str(case_request.request_id)}
+    )
+    profile_urls = {profile.pk: get_profile_api_urls(profile) for profile in profiles}
+    unique_urls = {url for urls in profile_urls.values() for url in urls.values()}
+
+    responses = {}
+    future_to_url = {
+        api_call_executor.submit(call_prediction_api, url, body, form_content_type): url
+        for url in unique_urls
+    }
+    # Bound the whole fan-out, not just each call; slow services are reported as errors
+    budget = max(profile.api_timeout for profile in profiles)
+    done, not_done = concurrent.futures.wait(future_to_url, timeout=budget)
+    for future in done:
+        url = future_to_url[future]
         try:
-            segment_data = base64.b64decode(segment_b64)
-            segment_image = Image.open(io.BytesIO(segment_data))
-            
-            img_buffer = io.BytesIO()
-            segment_image.save(img_buffer, format='PNG')
-            img_buffer.seek(0)
-            
-            segment, _ = Segment.objects.update_or_create(
-                case_request=case_request,
-                class_name=class_name,
-                model_version=model_version,
-                defaults={
-                    'width': segment_image.width,
-                    'height': segment_image.height,
-                    'file_size': len(segment_data),
-                }
-            )
-            # Include version as subdirectory to prevent overwriting
-            safe_class_name = class_name.replace(' ', '_').lower()
-            filename = f"segments/{model_version}/{safe_class_name}_segment.png"
-            segment.segment_image.save(filename, ContentFile(img_buffer.getvalue()), save=True)
-        except Exception as e:
-            logger.error(f"Error saving segment for {class_name}: {e}")
+            responses[url] = future.result()
+        except Exception as exc:
+            responses[url] = exc
+    for future in not_done:
+        # Only stops calls still queued; running ones finish on api_call_executor and are discarded
+        future.cancel()
+        responses[future_to_url[future]] = TimeoutError(f"no response within {budget}s")
 
-        
+    api_results = {}
+    for profile in profiles:
+        results = {}
+        errors = []
+        for name, url in profile_urls[profile.pk].items():
+            res = responses[url]
+            if isinstance(res, Exception):
+                msg = f"Exception calling {name}: {res}"
+                logger.error(msg)
+                errors.append(msg)
+            elif isinstance(res, dict) and 'error' in res:
+                msg = f"API Error [{name}]: {res['error']}"
+                logger.error(msg)
+                errors.append(msg)
+            else:
+                results[name] = res
+        api_results[profile.pk] = (results, errors)
+    return api_results
 
 
-def process_profile_workflow(case_request, profile, raw_image, file_data, filename, content_type):
+def process_profile_workflow(case_request, profile, raw_image, file_data, filename, content_type, api_results=None):
     """
     Helper function to process a single profile:
-    1. Call APIs
+    1. Call APIs (skipped when api_results from call_profile_apis is given)
     2. Save Predictions/Segments
     3. Generate Overlay
     4. Save OverlayHeatmap with version
@@ -150,68 +518,25 @@ def process_profile_workflow(case_request, profile, raw_image, file_data, filena
     Returns: (success, errors)
     """
     logger.info(f"Processing profile: {profile.name}")
-    errors = []
     
     # Determine version for config and DB
-    version_key = "v3.5.1"
-    if "v4.5.0" in profile.name:
-        version_key = "v4.5.0"
+    version_key = profile_version_key(profile)
 
     # 1. Call APIs
-    urls = {}
-    for model in profile.cxr_models.filter(is_active=True):
-        urls[model.service_type] = model.api_url
-
-    data = {'request_id': str(case_request.request_id)}
-    
-    results = {}
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future_to_url = {
-            executor.submit(
-                call_prediction_api, 
-                url, 
-                file_data, 
-                filename, 
-                content_type, 
-                data
-            ): name 
-            for name, url in urls.items()
-        }
-        
-        for future in concurrent.futures.as_completed(future_to_url):
-            name = future_to_url[future]
-            try:
-                res = future.result()
-                if isinstance(res, dict) and 'error' in res:
-                     msg = f"API Error [{name}]: {res['error']}"
-                     logger.error(msg)
-                     errors.append(msg)
-                else:
-                    results[name] = res
-            except Exception as exc:
-                msg = f"Exception calling {name}: {exc}"
-                logger.error(msg)
-                errors.append(msg)
+    if api_results is None:
+        api_results = call_profile_apis(case_request, [profile], file_data, filename, content_type)[profile.pk]
+    results, errors = api_results
+    errors = list(errors)
 
-    # 2. Process results (Saves to DB with version)
+    # Files written in step 2 stay available locally for the overlay step
+    temp_manager = TempFileManager()
+
+    # 2. Process results (Saves to DB with version); files are removed again if the rows roll back
     try:
-        if 'result' in results.get('abnormality', {}):
-            process_prediction_result(case_request, results['abnormality']['result'], version_key)
-        
-        if 'result' in results.get('tuberculosis', {}):
-            process_prediction_result(case_request, results['tuberculosis']['result'], version_key)
-            
-        if 'result' in results.get('pneumothorax', {}):
-            process_prediction_result(case_request, results['pneumothorax']['result'], version_key)
-        
-        if 'result' in results.get('lung_segmentation', {}):
-            process_segmentation_result(case_request, results['lung_segmentation']['result'], version_key)
-            
-        if 'result' in results.get('pleural_effusion_segmentation', {}):
-            process_segmentation_result(case_request, results['pleural_effusion_segmentation']['result'], version_key)
-            
-        if 'result' in results.get('pneumothorax_segmentation', {}):
-            process_segmentation_result(case_request, results['pneumothorax_segmentation']['result'], version_key)
+        with StorageWrites() as stored, transaction.atomic():
+            for service_type, handler in RESULT_HANDLERS.items():
+                if 'result' in results.get(service_type, {}):
+                    handler(case_request, results[service_type]['result'], version_key, temp_manager, stored)
     except Exception as e:
         msg = f"Error processing results for {version_key}: {e}"
         logger.error(msg)
@@ -220,35 +545,42 @@ def process_profile_workflow(case_request, profile, raw_image, file_data, filena
 
     # 3. Heatmap orchestration (Overlay)
     try:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        
-        if version_key == "v4.5.0":
-            config_path = os.path.join(current_dir, 'heatmap_orchestrate', 'configs', 'config_v4.yml')
-            overlay_config_path = os.path.join(current_dir, 'heatmap_orchestrate', 'configs', 'overlay_config_v4.yml')
-        else:
-            config_path = os.path.join(current_dir, 'heatmap_orchestrate', 'configs', 'config.yml')
-            overlay_config_path = os.path.join(current_dir, 'heatmap_orchestrate', 'configs', 'overlay_config.yml')
-
-        custom_config = HeatmapConfig(config_path)
-        custom_overlay_config = InspectraImageOverlayConfig(overlay_config_path)
+        custom_config, custom_overlay_config = load_heatmap_configs(version_key)
         processor = HeatmapOverlayProcessor(config=custom_config, overlay_config=custom_overlay_config)
 
-        temp_manager = TempFileManager()
-
         try:
             heatmap_paths = {}
             confidence_scores = {}
             heatmap_settings = {}
 
             # Collect heatmaps and scores from Predictions (filtered by version)
-            predictions = Prediction.objects.filter(case_request=case_request, model_version=version_key)
+            predictions = Prediction.objects.filter(
+                case_request=case_request, model_version=version_key
+            ).select_related('heatmap').only(
+                'disease_name', 'balanced_score', 'thresholded_percentage', 'heatmap__heatmap_image'
+            )
+            # Looked up again per segment below; one query, with heatmaps joined in
+            pred_by_disease = {pred.disease_name: pred for pred in predictions}
             
-            low_threshold_diseases = set()
-            for pred in predictions:
-                if pred.thresholded_percentage == 'Low':
-                    low_threshold_diseases.add(pred.disease_name)
+            # Low-threshold diseases are skipped for both heatmaps and segments
+            low_threshold_diseases = {
+                name for name, pred in pred_by_disease.items() if pred.thresholded_percentage == 'Low'
+            }
+            segments = Segment.objects.filter(
+                case_request=case_request, model_version=version_key
+            ).only('class_name', 'segment_image')
 
-            for pred in predictions:
+            # Fetch everything the processor reads up front, concurrently (only downloads on S3)
+            temp_manager.prefetch(
+                [pred.heatmap.heatmap_image for pred in pred_by_disease.values()
+                 if pred.disease_name not in low_threshold_diseases and pred.disease_name != 'Cardiomegaly'
+                 and hasattr(pred, 'heatmap')]
+                + [seg.segment_image for seg in segments if seg.class_name not in low_threshold_diseases]
+                + [raw_image.image],
+                prediction_executor,
+            )
+
+            for pred in pred_by_disease.values():
                 if pred.disease_name in low_threshold_diseases:
                     continue
                 
@@ -265,7 +597,6 @@ def process_profile_workflow(case_request, profile, raw_image, file_data, filena
                         heatmap_settings[pred.disease_name] = custom_config.get_heatmap_setting(pred.disease_name)
 
             # Collect segments (filtered by version)
-            segments = Segment.objects.filter(case_request=case_request, model_version=version_key)
             lung_mask_path = None
             lung_convex_mask_path = None
             fallback_heatmap_paths = {}
@@ -285,7 +616,7 @@ def process_profile_workflow(case_request, profile, raw_image, file_data, filena
                         if seg.class_name == 'Pneumothorax':
                             heatmap_paths['Pneumothorax'] = path
                             heatmap_settings['Pneumothorax'] = custom_config.get_heatmap_setting('Pneumothorax')
-                            pred = predictions.filter(disease_name='Pneumothorax').first()
+                            pred = pred_by_disease.get('Pneumothorax')
                             if pred and hasattr(pred, 'heatmap') and pred.heatmap.heatmap_image:
                                 fallback_path = temp_manager.get_path(pred.heatmap.heatmap_image)
                                 if fallback_path:
@@ -293,7 +624,7 @@ def process_profile_workflow(case_request, profile, raw_image, file_data, filena
                         else:
                             heatmap_paths[seg.class_name + ' Segmentation'] = path
                             heatmap_settings[seg.class_name + ' Segmentation'] = custom_config.get_heatmap_setting(seg.class_name)
-                            pred = predictions.filter(disease_name=seg.class_name).first()
+                            pred = pred_by_disease.get(seg.class_name)
                             if pred:
                                 confidence_scores[seg.class_name + ' Segmentation'] = pred.balanced_score
             
@@ -304,6 +635,8 @@ def process_profile_workflow(case_request, profile, raw_image, file_data, filena
             if lung_mask_path and raw_image_path:
                 with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
                     output_path = tmp_file.name
+                # Removed with the other temp files, whether or not the processor succeeds
+                temp_manager.temp_files.append(output_path)
 
                 if version_key == "v4.5.0":
                     result = processor.process_from_files(
@@ -335,179 +668,175 @@ def process_profile_workflow(case_request, profile, raw_image, file_data, filena
                     )
 
                 if result is not None and os.path.exists(output_path):
+                    # Individual overlays are encoded and written on the pool while the composite is saved
+                    individual_overlays = result.get('individual_overlays', {}) if isinstance(result, dict) else {}
+                    stored = StorageWrites()
+                    futures = [
+                        prediction_executor.submit(build_processed_heatmap, case_request, disease_name, overlay_img, version_key, stored)
+                        for disease_name, overlay_img in individual_overlays.items()
+                    ]
+                    stored.pending = futures
+
                     # 4. Save to OverlayHeatmap model
-                    with open(output_path, 'rb') as f:
-                        overlay_content = f.read()
-                        
-                    overlay, _ = OverlayHeatmap.objects.update_or_create(
-                        case_request=case_request,
-                        version=version_key,
-                        defaults={
-                            'width': raw_image.width,
-                            'height': raw_image.height,
-                            'file_size': len(overlay_content)
-                        }
-                    )
-                    # Save with a unique name including version
-                    overlay.overlay_image.save(f"overlay_heatmap_{version_key}.png", ContentFile(overlay_content), save=True)
-                    
-                    os.remove(output_path)
+                    # One commit for the overlay rows instead of one per row
+                    with stored, transaction.atomic():
+                        overlay, _ = OverlayHeatmap.objects.update_or_create(
+                            case_request=case_request,
+                            version=version_key,
+                            defaults={
+                                'width': raw_image.width,
+                                'height': raw_image.height,
+                                'file_size': os.path.getsize(output_path)
+                            }
+                        )
+                        # Save with a unique name including version; storage copies from the
+                        # temp file in chunks instead of buffering the whole PNG
+                        with open(output_path, 'rb') as f:
+                            overlay.overlay_image.save(f"overlay_heatmap_{version_key}.png", File(f), save=False)
+                        stored.add(overlay.overlay_image)
+                        overlay.save()
                     
-                    # 5. Save individual heatmap overlays for each positive disease
-                    # These are generated with proper processing (watershed/blur/gamma) by the processor
-                    if isinstance(result, dict) and 'individual_overlays' in result:
-                        import cv2
-                        
-                        individual_overlays = result['individual_overlays']
-                        for disease_name, overlay_img in individual_overlays.items():
-                            try:
-                                # Encode image as PNG
-                                success, encoded_img = cv2.imencode('.png', overlay_img)
-                                if success:
-                                    img_content = encoded_img.tobytes()
-                                    
-                                    processed_heatmap, _ = ProcessedHeatmap.objects.update_or_create(
-                                        case_request=case_request,
-                                        disease_name=disease_name,
-                                        model_version=version_key,
-                                        defaults={
-                                            'width': overlay_img.shape[1],
-                                            'height': overlay_img.shape[0],
-                                            'file_size': len(img_content)
-                                        }
-                                    )
-                                    safe_disease_name = disease_name.lower().replace(' ', '_')
-                                    processed_heatmap.heatmap_image.save(
-                                        f"{safe_disease_name}_overlay.png",
-                                        ContentFile(img_content),
-                                        save=True
-                                    )
-                                    logger.info(f"Saved individual heatmap for {disease_name} ({version_key})")
-                            except Exception as e:
-                                logger.warning(f"Failed to save individual heatmap for {disease_name}: {e}")
+                        # 5. Save individual heatmap overlays for each positive disease
+                        # These are generated with proper processing (watershed/blur/gamma) by the processor
+                        if futures:
+                            processed_heatmaps = [heatmap for heatmap in (future.result() for future in futures) if heatmap]
+                            ProcessedHeatmap.objects.bulk_create(
+                                processed_heatmaps,
+                                update_conflicts=True,
+                                unique_fields=['case_request', 'disease_name', 'model_version'],
+                                update_fields=['heatmap_image', 'width', 'height', 'file_size', 'updated_at'],
+                            )
+                            logger.info(f"Saved {len(processed_heatmaps)} individual heatmaps ({version_key})")
                     
                     return True, errors
         finally:
-            if 'temp_manager' in locals():
-                temp_manager.cleanup()
+            temp_manager.cleanup()
 
     except Exception as e:
         msg = f"Error in overlay generation for {profile.name}: {e}"
-        logger.error(msg)
-        import traceback
-        traceback.print_exc()
+        logger.exception(msg)
         errors.append(msg)
+        temp_manager.cleanup()
     
     return False, errors
 
 
+def process_profile_workflow_in_thread(case_request, profile, raw_image_pk, *args):
+    """
+    process_profile_workflow for a workflow_executor thread.
+    Loads its own RawImage so the two workflows don't share a FieldFile, and handles the
+    thread's DB connection the way request_started/request_finished do for request threads.
+    """
+    close_old_connections()
+    try:
+        raw_image = RawImage.objects.get(pk=raw_image_pk)
+        return process_profile_workflow(case_request, profile, raw_image, *args)
+    finally:
+        close_old_connections()
+
+
 def upload_test(request):
     if request.method == 'POST':
         if 'image' in request.FILES:
             uploaded_file = request.FILES['image']
             
             # Find profiles
-            profile_v3 = PredictionProfile.objects.filter(name__icontains="v3.5.1", is_active=True).first()
-            profile_v4 = PredictionProfile.objects.filter(name__icontains="v4.5.0", is_active=True).first()
-            
-            if not profile_v3 or not profile_v4:
-                 # Fallback search if exact names not found
-                profiles = PredictionProfile.objects.filter(is_active=True)
-                for p in profiles:
-                    if "v3" in p.name and not profile_v3: profile_v3 = p
-                    if "v4" in p.name and not profile_v4: profile_v4 = p
+            profile_v3, profile_v4 = find_upload_profiles()
             
             if not profile_v3 or not profile_v4:
                 return HttpResponse(f"<h2>Error: Could not find both v3.5.1 and v4.5.0 profiles. Found: v3={profile_v3}, v4={profile_v4}</h2>")
 
-            # Create CaseRequest
-            case_request = CaseRequest.objects.create()
+            with transaction.atomic():
+                # Create CaseRequest
+                case_request = CaseRequest.objects.create()
 
-            # Create RawImage instance
-            raw_image = RawImage()
-            raw_image.case_request = case_request
+                # Create RawImage instance
+                raw_image = RawImage()
+                raw_image.case_request = case_request
             
-            # Check if DICOM
-            is_dicom = uploaded_file.name.lower().endswith('.dcm')
+                # Check if DICOM
+                is_dicom = uploaded_file.name.lower().endswith('.dcm')
             
-            if is_dicom:
-                # 1. Save DICOM file
-                dicom_file = DicomFile.objects.create(
-                    case_request=case_request,
-                    file=uploaded_file,
-                    original_filename=uploaded_file.name,
-                    file_size=uploaded_file.size
-                )
+                if is_dicom:
+                    # 1. Save DICOM file
+                    # Read the upload once; storage and the DICOM decoder share the bytes
+                    dicom_data = uploaded_file.read()
+                    dicom_file = DicomFile.objects.create(
+                        case_request=case_request,
+                        file=ContentFile(dicom_data, name=uploaded_file.name),
+                        original_filename=uploaded_file.name,
+                        file_size=uploaded_file.size
+                    )
                 
-                # 2. Convert to Image
-                try:
-                     # Reset pointer for conversion reading
-                    uploaded_file.seek(0)
-                    pil_image = convert_dicom_to_image(uploaded_file)
+                    # 2. Convert to Image
+                    try:
+                        pil_image = convert_dicom_to_image(io.BytesIO(dicom_data))
                     
-                    # Save to buffer as PNG
-                    img_buffer = io.BytesIO()
-                    pil_image.save(img_buffer, format='PNG')
-                    img_buffer.seek(0)
+                        # Encode as PNG once; the same bytes back the RawImage and the API calls
+                        img_buffer = io.BytesIO()
+                        pil_image.save(img_buffer, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
+                        file_data = img_buffer.getvalue()
                     
-                    # Create ContentFile for RawImage
-                    file_content = ContentFile(img_buffer.getvalue())
-                    new_filename = os.path.splitext(uploaded_file.name)[0] + ".png"
+                        # Create ContentFile for RawImage
+                        file_content = ContentFile(file_data)
+                        new_filename = os.path.splitext(uploaded_file.name)[0] + ".png"
                     
-                    raw_image.image.save(new_filename, file_content, save=False)
-                    raw_image.original_filename = uploaded_file.name # Keep original name reference or change? Keeping original seems fine for tracking.
-                    raw_image.content_type = 'image/png'
-                    raw_image.file_size = len(img_buffer.getvalue())
-                    raw_image.width = pil_image.width
-                    raw_image.height = pil_image.height
+                        raw_image.image.save(new_filename, file_content, save=False)
+                        raw_image.original_filename = uploaded_file.name # Keep original name reference or change? Keeping original seems fine for tracking.
+                        raw_image.content_type = 'image/png'
+                        raw_image.file_size = len(file_data)
+                        raw_image.width = pil_image.width
+                        raw_image.height = pil_image.height
                     
-                    # Prepare data for processing (use the converted PNG data)
-                    file_data = img_buffer.getvalue()
-                    content_type_for_api = 'image/png'
-                    filename_for_api = new_filename
+                        # Prepare data for processing (use the converted PNG data)
+                        content_type_for_api = 'image/png'
+                        filename_for_api = new_filename
                     
-                except Exception as e:
-                    return HttpResponse(f"<h2>Error processing DICOM file: {e}</h2>")
+                    except Exception as e:
+                        return HttpResponse(f"<h2>Error processing DICOM file: {e}</h2>")
                 
-            else:
-                # Normal Image flow
-                raw_image.image = uploaded_file
-                raw_image.original_filename = uploaded_file.name
-                raw_image.content_type = uploaded_file.content_type
-                raw_image.file_size = uploaded_file.size
+                else:
+                    # Normal Image flow
+                    # Read the upload once; storage and the prediction APIs share the bytes
+                    file_data = uploaded_file.read()
+                    raw_image.image = ContentFile(file_data, name=uploaded_file.name)
+                    raw_image.original_filename = uploaded_file.name
+                    raw_image.content_type = uploaded_file.content_type
+                    raw_image.file_size = uploaded_file.size
                 
-                try:
-                    img = Image.open(uploaded_file)
-                    raw_image.width, raw_image.height = img.size
-                except Exception:
-                    pass
-
-                # Read file content for processing
-                uploaded_file.seek(0)
-                file_data = uploaded_file.read()
-                content_type_for_api = uploaded_file.content_type
-                filename_for_api = uploaded_file.name
+                    size = peek_image_size(io.BytesIO(file_data))
+                    if size:
+                        raw_image.width, raw_image.height = size
 
-            raw_image.save()
-            case_request.success_upload = True
-            case_request.save()
+                    content_type_for_api = uploaded_file.content_type
+                    filename_for_api = uploaded_file.name
+
+                raw_image.save()
+                case_request.success_upload = True
+                case_request.save(update_fields=['success_upload', 'updated_at'])
 
             # (File data already prepared above)
 
             all_errors = []
 
+            # Call both profiles' APIs up front so the requests overlap
+            api_results = call_profile_apis(case_request, [profile_v3, profile_v4], file_data, filename_for_api, content_type_for_api)
+
+            # Process v4.5.0 on a worker while v3.5.1 runs here; the profiles write separate rows
+            future_v4 = workflow_executor.submit(process_profile_workflow_in_thread, case_request, profile_v4, raw_image.pk, file_data, filename_for_api, content_type_for_api, api_results[profile_v4.pk])
+
             # Process v3.5.1
-            success_v3, errors_v3 = process_profile_workflow(case_request, profile_v3, raw_image, file_data, filename_for_api, content_type_for_api)
+            success_v3, errors_v3 = process_profile_workflow(case_request, profile_v3, raw_image, file_data, filename_for_api, content_type_for_api, api_results[profile_v3.pk])
             if errors_v3:
                 all_errors.extend([f"[v3.5.1] {e}" for e in errors_v3])
 
-            # Process v4.5.0
-            success_v4, errors_v4 = process_profile_workflow(case_request, profile_v4, raw_image, file_data, filename_for_api, content_type_for_api)
+            success_v4, errors_v4 = future_v4.result()
             if errors_v4:
                 all_errors.extend([f"[v4.5.0] {e}" for e in errors_v4])
 
             case_request.success_process = success_v3 and success_v4 
-            case_request.save()
+            case_request.summary_json = build_case_summary(case_request)
+            case_request.save(update_fields=['success_process', 'summary_json', 'updated_at'])
 
             # Retrieve overlays for display
             overlay_v3 = OverlayHeatmap.objects.filter(case_request=case_request, version="v3.5.1").first()
@@ -595,6 +924,144 @@ def upload_test(request):
 # REST API Endpoints for React Frontend
 # =============================================================================
 
+# Disease groups summarised in the case list; TB names are checked in this order
+TB_DISEASES = ('Tuberculosis', 'Inspectra Lung Opacity v2')
+ABNORMALITY_DISEASES = frozenset({'Pneumothorax', 'Pleural Effusion', 'Cardiomegaly', 'Atelectasis', 'Edema', 'Nodule', 'Mass', 'Lung Opacity'})
+# Pneumothorax has its own column, so the abnormality score covers the rest
+ABNORMALITY_CLASSES = ABNORMALITY_DISEASES - {'Pneumothorax'}
+
+# How long the case list's total count is reused; a new upload can take this long to show up in
+# total_count/total_pages, while the rows of each page are always read live
+CASE_COUNT_CACHE_TIMEOUT = 30
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator whose COUNT(*) is cached under count_key, so a page costs only its SELECT."""
+
+    def __init__(self, object_list, per_page, count_key, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+
+    @functools.cached_property
+    def count(self):
+        return cache.get_or_set(self.count_key, self.object_list.count, CASE_COUNT_CACHE_TIMEOUT)
+
+
+def summarize_version_predictions(predictions):
+    """Get summary for a specific model version's predictions (rows with disease_name/thresholded_* attributes)"""
+    # Disease names are unique per case and version
+    by_name = {p.disease_name: p for p in predictions}
+    
+    # Tuberculosis: check if TB or Inspectra Lung Opacity v2 is positive
+    tb_score = None
+    tb_status = 'none'  # none, low, positive
+    for name in TB_DISEASES:
+        pred = by_name.get(name)
+        if pred:
+            if pred.thresholded_percentage != 'Low':
+                tb_score = pred.thresholded_percentage
+                tb_status = 'positive'
+                break
+            else:
+                tb_status = 'low'
+    
+    # Pneumothorax
+    pneumo_pred = by_name.get('Pneumothorax')
+    pneumo_status = 'none'
+    pneumo_score = None
+    if pneumo_pred:
+        if pneumo_pred.thresholded_percentage != 'Low':
+            pneumo_status = 'positive'
+            pneumo_score = pneumo_pred.thresholded_percentage
+        else:
+            pneumo_status = 'low'
+    
+    # Abnormality: max score from remaining classes (excluding TB diseases and Pneumothorax)
+    abnormality_preds = [p for p in predictions if p.disease_name in ABNORMALITY_CLASSES]
+    abnormality_positive = any(p.thresholded_percentage != 'Low' for p in abnormality_preds)
+    abnormality_status = 'none'
+    max_abnormality_score = None
+    if abnormality_preds:
+        if abnormality_positive:
+            abnormality_status = 'positive'
+            # thresholded_value is parsed at write time; rows saved before that column existed are parsed here
+            scored = [
+                (p.thresholded_value if p.thresholded_value is not None else parse_thresholded_percentage(p.thresholded_percentage), p)
+                for p in abnormality_preds if p.thresholded_percentage != 'Low'
+            ]
+            best = max((item for item in scored if item[0]), key=lambda item: item[0], default=None)
+            if best:
+                max_abnormality_score = best[1].thresholded_percentage
+            else:
+                # Couldn't parse a percentage, use the first label as fallback
+                max_abnormality_score = next((p.thresholded_percentage for value, p in scored if value is None), None)
+        else:
+            abnormality_status = 'low'
+    
+    # Build results list (all 3 models with status)
+    results = [
+        {'name': 'Tuberculosis', 'score': tb_score, 'status': tb_status},
+        {'name': 'Pneumothorax', 'score': pneumo_score, 'status': pneumo_status},
+        {'name': 'Abnormality', 'score': max_abnormality_score, 'status': abnormality_status},
+    ]
+    
+    # Build conditions list (all non-Low predictions)
+    conditions = []
+    for pred in predictions:
+        if pred.thresholded_percentage != 'Low':
+            conditions.append({
+                'name': pred.disease_name,
+                'thresholded': pred.thresholded_percentage
+            })
+    
+    return {
+        'results': results,
+        'conditions': conditions,
+    }
+
+
+def build_case_summaries(case_ids):
+    """
+    The case list's v3/v4 summaries (as stored on CaseRequest.summary_json) for several cases,
+    from both versions' predictions in one query. Returns: {case pk: summary}
+    """
+    if not case_ids:
+        return {}
+    version_predictions = {(pk, version): [] for pk in case_ids for version in ('v3.5.1', 'v4.5.0')}
+    predictions = Prediction.objects.filter(
+        case_request__in=case_ids, model_version__in=['v3.5.1', 'v4.5.0']
+    ).values_list('case_request_id', 'model_version', 'disease_name', 'thresholded_percentage', 'thresholded_value', named=True)
+    for pred in predictions:
+        version_predictions[pred.case_request_id, pred.model_version].append(pred)
+    return {
+        pk: {
+            'v3': summarize_version_predictions(version_predictions[pk, 'v3.5.1']),
+            'v4': summarize_version_predictions(version_predictions[pk, 'v4.5.0']),
+        }
+        for pk in case_ids
+    }
+
+
+def build_case_summary(case_request):
+    """The case list's v3/v4 summaries for one case, stored on CaseRequest.summary_json."""
+    return build_case_summaries([case_request.pk])[case_request.pk]
+
+
+def case_search_filter(search):
+    """
+    Lookup for the case list's request_id search.
+    A pasted full request ID is matched exactly so it uses the unique index; icontains scans every row.
+    """
+    try:
+        request_id = uuid.UUID(search)
+    except ValueError:
+        return {'request_id__icontains': search}
+    # UUID() also parses hex without hyphens, braces and urn: forms, which icontains would not match
+    if str(request_id) != search.lower():
+        return {'request_id__icontains': search}
+    return {'request_id': request_id}
+
+
 @require_http_methods(["GET"])
 def api_case_list(request):
     """
@@ -620,108 +1087,45 @@ def api_case_list(request):
     cases = CaseRequest.objects.filter(success_upload=True).order_by('-created_at')
     
     if search:
-        cases = cases.filter(request_id__icontains=search)
+        cases = cases.filter(**case_search_filter(search))
+    
+    # The page is only serialized, so read it as plain dicts of the columns the rows use
+    cases = cases.values('pk', 'request_id', 'created_at', 'success_process', 'summary_json')
     
-    paginator = Paginator(cases, page_size)
+    # Key on a digest of the search term: it is user input and may not be a valid cache key as-is
+    count_key = f"case_count:{hashlib.md5(search.encode(), usedforsecurity=False).hexdigest()}"
+    paginator = CachedCountPaginator(cases, page_size, count_key)
     page_obj = paginator.get_page(page)
+    page_ids = [case['pk'] for case in page_obj]
     
-    # Define disease groups
-    TB_DISEASES = ['Tuberculosis', 'Inspectra Lung Opacity v2']
-    ABNORMALITY_DISEASES = ['Pneumothorax', 'Pleural Effusion', 'Cardiomegaly', 'Atelectasis', 'Edema', 'Nodule', 'Mass', 'Lung Opacity']
-    
-    def get_version_summary(predictions):
-        """Get summary for a specific model version's predictions"""
-        # Tuberculosis: check if TB or Inspectra Lung Opacity v2 is positive
-        tb_preds = [p for p in predictions if p.disease_name in TB_DISEASES]
-        tb_positive = any(p.thresholded_percentage != 'Low' for p in tb_preds)
-        tb_score = None
-        tb_status = 'none'  # none, low, positive
-        if tb_preds:
-            for name in TB_DISEASES:
-                pred = next((p for p in predictions if p.disease_name == name), None)
-                if pred:
-                    if pred.thresholded_percentage != 'Low':
-                        tb_score = pred.thresholded_percentage
-                        tb_status = 'positive'
-                        break
-                    else:
-                        tb_status = 'low'
-        
-        # Pneumothorax
-        pneumo_pred = next((p for p in predictions if p.disease_name == 'Pneumothorax'), None)
-        pneumo_status = 'none'
-        pneumo_score = None
-        if pneumo_pred:
-            if pneumo_pred.thresholded_percentage != 'Low':
-                pneumo_status = 'positive'
-                pneumo_score = pneumo_pred.thresholded_percentage
-            else:
-                pneumo_status = 'low'
-        
-        # Abnormality: max score from remaining classes (excluding TB diseases and Pneumothorax)
-        abnormality_preds = [p for p in predictions if p.disease_name in ABNORMALITY_DISEASES and p.disease_name != 'Pneumothorax']
-        abnormality_positive = any(p.thresholded_percentage != 'Low' for p in abnormality_preds)
-        abnormality_status = 'none'
-        max_abnormality_score = None
-        if abnormality_preds:
-            if abnormality_positive:
-                abnormality_status = 'positive'
-                max_abnormality_value = 0
-                for p in abnormality_preds:
-                    if p.thresholded_percentage != 'Low':
-                        try:
-                            val = int(p.thresholded_percentage.replace('%', ''))
-                            if val > max_abnormality_value:
-                                max_abnormality_value = val
-                                max_abnormality_score = p.thresholded_percentage
-                        except ValueError:
-                            # Couldn't parse percentage, use as fallback
-                            if max_abnormality_score is None:
-                                max_abnormality_score = p.thresholded_percentage
-            else:
-                abnormality_status = 'low'
-        
-        # Build results list (all 3 models with status)
-        results = [
-            {'name': 'Tuberculosis', 'score': tb_score, 'status': tb_status},
-            {'name': 'Pneumothorax', 'score': pneumo_score, 'status': pneumo_status},
-            {'name': 'Abnormality', 'score': max_abnormality_score, 'status': abnormality_status},
-        ]
-        
-        # Build conditions list (all non-Low predictions)
-        conditions = []
-        for pred in predictions:
-            if pred.thresholded_percentage != 'Low':
-                conditions.append({
-                    'name': pred.disease_name,
-                    'thresholded': pred.thresholded_percentage
-                })
-        
-        return {
-            'results': results,
-            'conditions': conditions,
-        }
+    # Raw images for the whole page in one query; the newest per case, as the default ordering gives
+    raw_images = {}
+    for raw_image in RawImage.objects.filter(case_request__in=page_ids).values_list(
+        'case_request_id', 'original_filename', 'image', named=True
+    ):
+        raw_images.setdefault(raw_image.case_request_id, raw_image)
+    
+    # Summaries are stored when an upload finishes; cases without one (older or failed uploads, or
+    # predictions edited since) are summarized here from both versions' predictions in one query
+    live_summaries = build_case_summaries([case['pk'] for case in page_obj if case['summary_json'] is None])
     
     case_list = []
     for case in page_obj:
         # Get associated raw image
-        raw_image = RawImage.objects.filter(case_request=case).first()
+        raw_image = raw_images.get(case['pk'])
         
-        # Get predictions for both versions
-        predictions_v3 = list(Prediction.objects.filter(case_request=case, model_version='v3.5.1'))
-        predictions_v4 = list(Prediction.objects.filter(case_request=case, model_version='v4.5.0'))
-        
-        v3_summary = get_version_summary(predictions_v3)
-        v4_summary = get_version_summary(predictions_v4)
+        summary = case['summary_json']
+        if summary is None:
+            summary = live_summaries[case['pk']]
         
         case_list.append({
-            'request_id': str(case.request_id),
-            'created_at': case.created_at.isoformat(),
+            'request_id': str(case['request_id']),
+            'created_at': case['created_at'].isoformat(),
             'patient_name': raw_image.original_filename if raw_image else 'N/A',
-            'raw_image_url': raw_image.image.url if raw_image and raw_image.image else None,
-            'success_process': case.success_process,
-            'v3': v3_summary,
-            'v4': v4_summary,
+            'raw_image_url': default_storage.url(raw_image.image) if raw_image and raw_image.image else None,
+            'success_process': case['success_process'],
+            'v3': summary['v3'],
+            'v4': summary['v4'],
         })
     
     return JsonResponse({
@@ -745,51 +1149,46 @@ def api_case_detail(request, request_id):
     except CaseRequest.DoesNotExist:
         return JsonResponse({'error': 'Case not found'}, status=404)
     
+    # Uploads lost to a deploy or restart would otherwise stay processing forever
+    if case.is_processing and fail_stuck_uploads(CaseRequest.objects.filter(pk=case.pk)):
+        case.is_processing = False
+    
     # Get raw image
     raw_image = RawImage.objects.filter(case_request=case).first()
     
-    # Get predictions grouped by version
-    predictions_data = {}
-    for version in ['v3.5.1', 'v4.5.0']:
-        predictions = Prediction.objects.filter(case_request=case, model_version=version)
-        predictions_data[version] = [
-            {
-                'disease_name': pred.disease_name,
-                'prediction_value': pred.prediction_value,
-                'balanced_score': pred.balanced_score,
-                'thresholded_percentage': pred.thresholded_percentage,
-            }
-            for pred in predictions
-        ]
+    versions = ['v3.5.1', 'v4.5.0']
+    
+    # Get predictions grouped by version; plain dicts from one query, no model instances
+    predictions_data = {version: [] for version in versions}
+    for pred in Prediction.objects.filter(case_request=case, model_version__in=versions).values(
+        'model_version', 'disease_name', 'prediction_value', 'balanced_score', 'thresholded_percentage'
+    ):
+        predictions_data[pred.pop('model_version')].append(pred)
     
     # Get overlay heatmaps
     overlays = {}
-    for overlay in OverlayHeatmap.objects.filter(case_request=case):
-        overlays[overlay.version] = {
-            'url': overlay.overlay_image.url if overlay.overlay_image else None,
-            'width': overlay.width,
-            'height': overlay.height,
+    for overlay in OverlayHeatmap.objects.filter(case_request=case).values('version', 'overlay_image', 'width', 'height'):
+        overlays[overlay['version']] = {
+            'url': default_storage.url(overlay['overlay_image']) if overlay['overlay_image'] else None,
+            'width': overlay['width'],
+            'height': overlay['height'],
         }
     
     # Get individual processed heatmaps for positive diseases
-    individual_heatmaps = {}
-    for version in ['v3.5.1', 'v4.5.0']:
-        processed_heatmaps = ProcessedHeatmap.objects.filter(
-            case_request=case, 
-            model_version=version
-        )
-        individual_heatmaps[version] = [
-            {
-                'disease_name': ph.disease_name,
-                'url': ph.heatmap_image.url if ph.heatmap_image else None,
-            }
-            for ph in processed_heatmaps
-        ]
+    individual_heatmaps = {version: [] for version in versions}
+    for ph in ProcessedHeatmap.objects.filter(case_request=case, model_version__in=versions).values(
+        'model_version', 'disease_name', 'heatmap_image'
+    ):
+        individual_heatmaps[ph['model_version']].append({
+            'disease_name': ph['disease_name'],
+            'url': default_storage.url(ph['heatmap_image']) if ph['heatmap_image'] else None,
+        })
     
     return JsonResponse({
         'request_id': str(case.request_id),
         'created_at': case.created_at.isoformat(),
         'success_process': case.success_process,
+        'is_processing': case.is_processing,
         'raw_image': {
             'url': raw_image.image.url if raw_image and raw_image.image else None,
             'filename': raw_image.original_filename if raw_image else None,
@@ -802,12 +1201,60 @@ def api_case_detail(request, request_id):
     })
 
 
+def process_uploaded_case(case_request_pk, profile_v3, profile_v4, file_data, filename, content_type):
+    """
+    Run both profiles on an upload_executor thread after api_upload has returned, then record the
+    outcome and clear is_processing. Handles the thread's DB connection like process_profile_workflow_in_thread.
+    """
+    close_old_connections()
+    case_request = None
+    try:
+        case_request = CaseRequest.objects.get(pk=case_request_pk)
+        # Time the job itself, not its wait in the queue, against MAX_PROCESSING_TIME
+        case_request.processing_started_at = timezone.now()
+        case_request.save(update_fields=['processing_started_at', 'updated_at'])
+        raw_image = RawImage.objects.filter(case_request=case_request).first()
+        all_errors = []
+        
+        # Call both profiles' APIs up front so the requests overlap
+        api_results = call_profile_apis(case_request, [profile_v3, profile_v4], file_data, filename, content_type)
+        
+        # v4.5.0 runs on a worker while v3.5.1 runs here; the profiles write separate rows
+        future_v4 = workflow_executor.submit(
+            process_profile_workflow_in_thread, case_request, profile_v4, raw_image.pk,
+            file_data, filename, content_type, api_results[profile_v4.pk]
+        )
+        
+        success_v3, errors_v3 = process_profile_workflow(
+            case_request, profile_v3, raw_image, file_data, filename, content_type, api_results[profile_v3.pk]
+        )
+        if errors_v3:
+            all_errors.extend([f"[v3.5.1] {e}" for e in errors_v3])
+        
+        success_v4, errors_v4 = future_v4.result()
+        if errors_v4:
+            all_errors.extend([f"[v4.5.0] {e}" for e in errors_v4])
+        
+        if all_errors:
+            logger.warning(f"Case {case_request.request_id} processed with errors: {all_errors}")
+        
+        case_request.success_process = success_v3 and success_v4
+        case_request.summary_json = build_case_summary(case_request)
+    except Exception:
+        logger.exception(f"Error processing case {case_request_pk}")
+    finally:
+        if case_request is not None:
+            case_request.is_processing = False
+            case_request.save(update_fields=['success_process', 'summary_json', 'is_processing', 'updated_at'])
+        close_old_connections()
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def api_upload(request):
     """
     POST /api/upload/
-    Upload an image and process it. Returns the case ID for redirect.
+    Upload an image and start processing it in the background. Returns the case ID for redirect.
     """
     if 'image' not in request.FILES:
         return api_error_response('No image file provided')
@@ -820,111 +1267,149 @@ def api_upload(request):
         return api_error_response(error_msg)
     
     # Find profiles
-    profile_v3 = PredictionProfile.objects.filter(name__icontains="v3.5.1", is_active=True).first()
-    profile_v4 = PredictionProfile.objects.filter(name__icontains="v4.5.0", is_active=True).first()
-    
-    if not profile_v3 or not profile_v4:
-        profiles = PredictionProfile.objects.filter(is_active=True)
-        for p in profiles:
-            if "v3" in p.name and not profile_v3: profile_v3 = p
-            if "v4" in p.name and not profile_v4: profile_v4 = p
+    profile_v3, profile_v4 = find_upload_profiles()
     
     if not profile_v3 or not profile_v4:
         return JsonResponse({
             'error': f'Could not find both prediction profiles. Found: v3={bool(profile_v3)}, v4={bool(profile_v4)}'
         }, status=500)
     
-    # Create CaseRequest
-    case_request = CaseRequest.objects.create()
-    raw_image = RawImage(case_request=case_request)
+    if not upload_slots.acquire(blocking=False):
+        return api_error_response('Too many uploads are being processed, please try again shortly', status=503)
     
     # Check if DICOM
     is_dicom = uploaded_file.name.lower().endswith('.dcm')
     
     try:
-        if is_dicom:
-            DicomFile.objects.create(
-                case_request=case_request,
-                file=uploaded_file,
-                original_filename=uploaded_file.name,
-                file_size=uploaded_file.size
-            )
+        # A failed upload (e.g. a DICOM that won't convert) also removes the files it already stored
+        with StorageWrites() as stored, transaction.atomic():
+            # Create CaseRequest
+            case_request = CaseRequest.objects.create(is_processing=True)
+            raw_image = RawImage(case_request=case_request)
             
-            uploaded_file.seek(0)
-            pil_image = convert_dicom_to_image(uploaded_file)
+            if is_dicom:
+                # Read the upload once; storage and the DICOM decoder share the bytes
+                dicom_data = uploaded_file.read()
+                dicom_file = DicomFile.objects.create(
+                    case_request=case_request,
+                    file=ContentFile(dicom_data, name=uploaded_file.name),
+                    original_filename=uploaded_file.name,
+                    file_size=uploaded_file.size
+                )
+                stored.add(dicom_file.file)
             
-            img_buffer = io.BytesIO()
-            pil_image.save(img_buffer, format='PNG')
-            img_buffer.seek(0)
+                pil_image = convert_dicom_to_image(io.BytesIO(dicom_data))
             
-            file_content = ContentFile(img_buffer.getvalue())
-            new_filename = os.path.splitext(uploaded_file.name)[0] + ".png"
+                img_buffer = io.BytesIO()
+                pil_image.save(img_buffer, format='PNG', compress_level=PNG_COMPRESS_LEVEL)
+                file_data = img_buffer.getvalue()
             
-            raw_image.image.save(new_filename, file_content, save=False)
-            raw_image.original_filename = uploaded_file.name
-            raw_image.content_type = 'image/png'
-            raw_image.file_size = len(img_buffer.getvalue())
-            raw_image.width = pil_image.width
-            raw_image.height = pil_image.height
+                file_content = ContentFile(file_data)
+                new_filename = os.path.splitext(uploaded_file.name)[0] + ".png"
             
-            file_data = img_buffer.getvalue()
-            content_type_for_api = 'image/png'
-            filename_for_api = new_filename
-        else:
-            raw_image.image = uploaded_file
-            raw_image.original_filename = uploaded_file.name
-            raw_image.content_type = uploaded_file.content_type
-            raw_image.file_size = uploaded_file.size
+                raw_image.image.save(new_filename, file_content, save=False)
+                stored.add(raw_image.image)
+                raw_image.original_filename = uploaded_file.name
+                raw_image.content_type = 'image/png'
+                raw_image.file_size = len(file_data)
+                raw_image.width = pil_image.width
+                raw_image.height = pil_image.height
             
-            try:
-                img = Image.open(uploaded_file)
-                raw_image.width, raw_image.height = img.size
-            except Exception:
-                pass
+                content_type_for_api = 'image/png'
+                filename_for_api = new_filename
+            else:
+                # Read the upload once; storage and the prediction APIs share the bytes
+                file_data = uploaded_file.read()
+                raw_image.image = ContentFile(file_data, name=uploaded_file.name)
+                raw_image.original_filename = uploaded_file.name
+                raw_image.content_type = uploaded_file.content_type
+                raw_image.file_size = uploaded_file.size
             
-            uploaded_file.seek(0)
-            file_data = uploaded_file.read()
-            content_type_for_api = uploaded_file.content_type
-            filename_for_api = uploaded_file.name
-        
-        raw_image.save()
-        case_request.success_upload = True
-        case_request.save()
-        
-        # Return immediately with case ID, processing happens async
-        # For sync processing (current behavior), process both profiles
-        all_errors = []
+                size = peek_image_size(io.BytesIO(file_data))
+                if size:
+                    raw_image.width, raw_image.height = size
+            
+                content_type_for_api = uploaded_file.content_type
+                filename_for_api = uploaded_file.name
         
-        success_v3, errors_v3 = process_profile_workflow(
-            case_request, profile_v3, raw_image, file_data, filename_for_api, content_type_for_api
-        )
-        if errors_v3:
-            all_errors.extend([f"[v3.5.1] {e}" for e in errors_v3])
+            raw_image.save()
+            stored.add(raw_image.image)
+            case_request.success_upload = True
+            case_request.save(update_fields=['success_upload', 'updated_at'])
         
-        success_v4, errors_v4 = process_profile_workflow(
-            case_request, profile_v4, raw_image, file_data, filename_for_api, content_type_for_api
+        # Return immediately with case ID, processing happens async; the preview page polls
+        # api_case_detail until is_processing clears
+        future = upload_executor.submit(
+            process_uploaded_case, case_request.pk, profile_v3, profile_v4,
+            file_data, filename_for_api, content_type_for_api
         )
-        if errors_v4:
-            all_errors.extend([f"[v4.5.0] {e}" for e in errors_v4])
-        
-        case_request.success_process = success_v3 and success_v4
-        case_request.save()
-        
-        return JsonResponse({
-            'request_id': str(case_request.request_id),
-            'success': case_request.success_process,
-            'errors': all_errors if all_errors else None,
-        })
-        
     except Exception as e:
+        upload_slots.release()
         logger.exception("Error processing upload")
         return JsonResponse({'error': str(e)}, status=500)
+    
+    future.add_done_callback(lambda _: upload_slots.release())
+    return JsonResponse({
+        'request_id': str(case_request.request_id),
+        'pending': True,
+    })
 
 
 # =============================================================================
 # V5 Experimental API (No DB persistence)
 # =============================================================================
 
+# v5 overlays are only kept briefly: a bucket lifecycle rule deletes objects under this prefix after
+# V5_OVERLAY_EXPIRY_DAYS. The createbuckets service adds it on deploy; scripts/configure_v5_overlay_expiry.py
+# adds it to an existing bucket. api_v5_predict refuses to store overlays while the rule is missing.
+V5_OVERLAY_PREFIX = 'v5_overlays/'
+V5_OVERLAY_EXPIRY_DAYS = 1
+V5_OVERLAY_EXPIRY_CACHE_KEY = 'v5_overlay_expiry_configured'
+V5_OVERLAY_EXPIRY_CACHE_TIMEOUT = 3600
+
+
+def get_bucket_lifecycle_rules():
+    """Lifecycle rules of the storage bucket; empty when it has no lifecycle configuration."""
+    client = default_storage.connection.meta.client
+    try:
+        return client.get_bucket_lifecycle_configuration(Bucket=default_storage.bucket_name)['Rules']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'NoSuchLifecycleConfiguration':
+            raise
+        return []
+
+
+def is_v5_overlay_expiry_rule(rule):
+    """True for an enabled rule expiring every object under V5_OVERLAY_PREFIX."""
+    prefix = rule.get('Filter', {}).get('Prefix', rule.get('Prefix'))
+    return rule.get('Status') == 'Enabled' and prefix == V5_OVERLAY_PREFIX and 'Days' in rule.get('Expiration', {})
+
+
+def v5_overlay_expiry_configured():
+    """
+    Check the bucket for the v5 overlay expiry rule. Only a positive answer is cached, so adding
+    the rule takes effect without a restart.
+    """
+    if cache.get(V5_OVERLAY_EXPIRY_CACHE_KEY):
+        return True
+    configured = any(is_v5_overlay_expiry_rule(rule) for rule in get_bucket_lifecycle_rules())
+    if configured:
+        cache.set(V5_OVERLAY_EXPIRY_CACHE_KEY, True, V5_OVERLAY_EXPIRY_CACHE_TIMEOUT)
+    return configured
+
+# v5 is often re-run on the same case (UI retries, comparing versions); keep the last few raw
+# images per process so those calls skip the storage read. Bounded to keep worker memory in check.
+V5_RAW_CACHE_SIZE = 4
+V5_RAW_CACHE_MAX_SIZE = 20 * 1024 * 1024  # 20 MB
+
+
+@functools.lru_cache(maxsize=V5_RAW_CACHE_SIZE)
+def read_v5_raw_image(raw_image_pk, name):
+    """Bytes of a stored raw image; raw images are never rewritten after upload."""
+    with default_storage.open(name, 'rb') as f:
+        return f.read()
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def api_v5_predict(request):
@@ -932,7 +1417,7 @@ def api_v5_predict(request):
     POST /api/v5/predict/
     Call v5 API for a case without saving to DB.
     Request body: { "request_id": "uuid" }
-    Returns: { predictions: [...], overlay_image: "data:image/png;base64,..." }
+    Returns: { predictions: [...], overlay_image: "<storage URL of the overlay PNG>" }
     """
     try:
         # Parse request body
@@ -957,8 +1442,11 @@ def api_v5_predict(request):
         
         # Read image data
         try:
-            raw_image.image.seek(0)
-            file_data = raw_image.image.read()
+            if raw_image.file_size and raw_image.file_size <= V5_RAW_CACHE_MAX_SIZE:
+                file_data = read_v5_raw_image(raw_image.pk, raw_image.image.name)
+            else:
+                raw_image.image.seek(0)
+                file_data = raw_image.image.read()
             content_type = raw_image.content_type or 'image/png'
             filename = raw_image.original_filename or 'image.png'
         except Exception as e:
@@ -970,12 +1458,20 @@ def api_v5_predict(request):
         if not v5_url:
             return api_error_response('V5 API not configured', status=500)
         
+        # Overlays are public objects in the bucket; without the expiry rule they would pile up forever
+        if not v5_overlay_expiry_configured():
+            logger.error(
+                f"Bucket has no lifecycle rule expiring {V5_OVERLAY_PREFIX}; run scripts/configure_v5_overlay_expiry.py"
+            )
+            return api_error_response('V5 overlay storage is not configured', status=503)
+        
         # Call v5 API
         logger.info(f"Calling v5 API: {v5_url} for case {request_id}")
         try:
             files = {'file': (filename, file_data, content_type)}
             data = {'request_id': str(request_id)}
-            response = requests.post(v5_url, files=files, data=data, timeout=60)
+            # Single attempt, no retries: the request must finish inside gunicorn's 120s timeout
+            response = v5_http_session.post(v5_url, files=files, data=data, timeout=V5_TIMEOUT)
             response.raise_for_status()
             v5_result = response.json()
         except requests.exceptions.Timeout:
@@ -996,9 +1492,18 @@ def api_v5_predict(request):
                 'thresholded_percentage': values.get('thresholded', 'Low'),
             })
         
-        # Get base64 overlay image
+        # Write the overlay to storage and return its URL rather than embedding ~33% larger base64 in
+        # the JSON; the browser then fetches the image itself. Named by content so a changed result never
+        # shows a stale cached image. No DB row is kept for it and the bucket expires the prefix.
         overlay_b64 = v5_result.get('overlay_heatmap_image', '')
-        overlay_image_url = f"data:image/png;base64,{overlay_b64}" if overlay_b64 else None
+        overlay_image_url = None
+        if overlay_b64:
+            overlay_data = binascii.a2b_base64(overlay_b64)
+            overlay_name = default_storage.save(
+                f"{V5_OVERLAY_PREFIX}{case.request_id}/{hashlib.md5(overlay_data, usedforsecurity=False).hexdigest()}{image_extension(overlay_data) or '.png'}",
+                ContentFile(overlay_data),
+            )
+            overlay_image_url = default_storage.url(overlay_name)
         
         return JsonResponse({
             'request_id': str(request_id),
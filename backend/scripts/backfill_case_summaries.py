@@ -0,0 +1,33 @@
+import os
+import django
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from myinspectra.models import CaseRequest
+from myinspectra.views import build_case_summaries
+
+# Store the case list summary on cases uploaded before CaseRequest.summary_json existed
+BATCH_SIZE = 500
+
+pending = CaseRequest.objects.filter(success_upload=True, summary_json__isnull=True).only('pk').order_by('pk')
+
+print("Backfilling case summaries...")
+total = 0
+last_pk = 0
+while True:
+    cases = list(pending.filter(pk__gt=last_pk)[:BATCH_SIZE])
+    if not cases:
+        break
+    last_pk = cases[-1].pk
+
+    summaries = build_case_summaries([case.pk for case in cases])
+    for case in cases:
+        case.summary_json = summaries[case.pk]
+    CaseRequest.objects.bulk_update(cases, ['summary_json'])
+    total += len(cases)
+    print(f"  {total} cases")
+
+print("\nDone!")
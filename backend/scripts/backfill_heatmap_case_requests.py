@@ -0,0 +1,20 @@
+import os
+import django
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from django.db.models import OuterRef, Subquery
+
+from myinspectra.models import Heatmap, Prediction
+
+# Fill Heatmap.case_request on heatmaps saved before that denormalized column existed
+print("Backfilling heatmap case requests...")
+updated = Heatmap.objects.filter(case_request__isnull=True).update(
+    case_request=Subquery(Prediction.objects.filter(pk=OuterRef('prediction_id')).values('case_request_id')[:1])
+)
+print(f"  {updated} heatmaps")
+
+print("\nDone!")
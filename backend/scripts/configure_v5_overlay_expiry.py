@@ -0,0 +1,29 @@
+import os
+import django
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from django.core.files.storage import default_storage
+
+from myinspectra.views import V5_OVERLAY_EXPIRY_DAYS, V5_OVERLAY_PREFIX, get_bucket_lifecycle_rules, is_v5_overlay_expiry_rule
+
+# Add (or replace) the bucket lifecycle rule that deletes v5 overlays, keeping any other rules
+RULE_ID = 'expire-v5-overlays'
+
+client = default_storage.connection.meta.client
+bucket = default_storage.bucket_name
+
+rules = [rule for rule in get_bucket_lifecycle_rules() if not is_v5_overlay_expiry_rule(rule) and rule.get('ID') != RULE_ID]
+rules.append({
+    'ID': RULE_ID,
+    'Filter': {'Prefix': V5_OVERLAY_PREFIX},
+    'Status': 'Enabled',
+    'Expiration': {'Days': V5_OVERLAY_EXPIRY_DAYS},
+})
+client.put_bucket_lifecycle_configuration(Bucket=bucket, LifecycleConfiguration={'Rules': rules})
+
+print(f"Objects under {bucket}/{V5_OVERLAY_PREFIX} now expire after {V5_OVERLAY_EXPIRY_DAYS} day(s)")
+print("\nDone!")
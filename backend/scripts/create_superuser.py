@@ -49,14 +49,14 @@ def create_superuser():
     User = get_user_model()
 
     try:
-        # Check if user already exists
-        if User.objects.filter(username=username).exists():
+        # Check if user already exists (one query fetches it if so)
+        user = User.objects.filter(username=username).first()
+        if user is not None:
             print(f"⚠ Warning: User '{username}' already exists. Updating password...")
-            user = User.objects.get(username=username)
             user.set_password(password)
             user.is_superuser = True
             user.is_staff = True
-            user.save()
+            user.save(update_fields=['password', 'is_superuser', 'is_staff'])
             print(f"✓ Updated existing user '{username}' with new password and superuser privileges")
         else:
             # Create new superuser
@@ -0,0 +1,38 @@
+import os
+import django
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from django.core.files.storage import default_storage
+from django.db.models import Count, Max
+
+from myinspectra.models import Segment
+
+# Remove duplicate segments (same case, class and model version) so the uniq_segment_case_class_version
+# constraint can be migrated in. Run before `migrate`; keeps the newest row of each group.
+duplicates = (
+    Segment.objects.order_by()
+    .values('case_request', 'class_name', 'model_version')
+    .annotate(count=Count('pk'), keep=Max('pk'))
+    .filter(count__gt=1)
+)
+
+print("Removing duplicate segments...")
+removed = 0
+for group in duplicates:
+    rows = Segment.objects.filter(
+        case_request=group['case_request'], class_name=group['class_name'], model_version=group['model_version']
+    )
+    kept_name = rows.filter(pk=group['keep']).values_list('segment_image', flat=True).get()
+    stale = rows.exclude(pk=group['keep'])
+    # Upload names can repeat, so only delete files the kept row doesn't use
+    stale_names = set(stale.values_list('segment_image', flat=True)) - {kept_name, ''}
+    removed += stale.delete()[0]
+    for name in stale_names:
+        default_storage.delete(name)
+print(f"  {removed} segments")
+
+print("\nDone!")
@@ -0,0 +1,17 @@
+import os
+import django
+
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+django.setup()
+
+from myinspectra.models import CaseRequest
+from myinspectra.views import fail_stuck_uploads
+
+# Fail uploads whose background job was lost to a deploy or restart, including cases nobody
+# has opened since (api_case_detail only fails the case it is showing). Safe to run from cron.
+print("Failing stuck uploads...")
+print(f"  {fail_stuck_uploads(CaseRequest.objects.all())} cases")
+
+print("\nDone!")
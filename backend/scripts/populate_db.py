@@ -42,14 +42,11 @@ print("\nCreating PredictionProfiles...")
 for profile_name, abnormality_version in profiles_data:
     profile, created = PredictionProfile.objects.get_or_create(name=profile_name)
     
-    # Add models to profile
-    # 1. Abnormality (specific version)
-    profile.cxr_models.add(created_models[('abnormality', abnormality_version)])
-    
-    # 2. Add all other standard services
-    for (service_type, version), model in created_models.items():
-        if service_type != 'abnormality':
-            profile.cxr_models.add(model)
+    # Add models to profile: the abnormality model of this version plus all other standard
+    # services, in one add() so the missing links go in with a single INSERT
+    profile_models = [created_models[('abnormality', abnormality_version)]]
+    profile_models += [model for (service_type, version), model in created_models.items() if service_type != 'abnormality']
+    profile.cxr_models.add(*profile_models)
             
     print(f"  {'Created' if created else 'Updated'}: {profile}")
     print(f"    Models: {', '.join([str(m) for m in profile.cxr_models.all()])}")
@@ -8,6 +8,10 @@ import './CasePreviewPage.css';
 
 type HeatmapVersion = 'raw' | 'v3.5.1' | 'v4.5.0' | 'v5';
 
+const PROCESSING_POLL_INTERVAL_MS = 2000;
+// Stop after ~32 minutes, past the longest the backend lets a case queue and then process
+const MAX_PROCESSING_POLLS = 960;
+
 function getScoreColor(score: string): string {
     // Green only for 'Low', red for everything over threshold
     if (score.toLowerCase() === 'low') return 'var(--color-success)';
@@ -59,6 +63,30 @@ export function CasePreviewPage() {
         loadCase();
     }, [requestId]);
 
+    // Uploads are processed in the background; reload the case until processing finishes
+    const processingPollsRef = useRef(0);
+    useEffect(() => {
+        processingPollsRef.current = 0;
+    }, [requestId]);
+
+    useEffect(() => {
+        if (!requestId || !caseData?.is_processing) return;
+        if (processingPollsRef.current >= MAX_PROCESSING_POLLS) {
+            setError('Processing is taking longer than expected. Please try again later.');
+            return;
+        }
+
+        const timer = setTimeout(async () => {
+            processingPollsRef.current += 1;
+            try {
+                setCaseData(await fetchCaseDetail(requestId));
+            } catch (err) {
+                setError(err instanceof Error ? err.message : 'Failed to load case');
+            }
+        }, PROCESSING_POLL_INTERVAL_MS);
+        return () => clearTimeout(timer);
+    }, [requestId, caseData]);
+
     // Reset selected disease when version changes
     useEffect(() => {
         setSelectedDisease(null);
@@ -136,7 +164,7 @@ export function CasePreviewPage() {
         if (!caseData) return null;
         if (selectedVersion === 'raw') return caseData.raw_image.url;
 
-        // V5: use base64 overlay from v5Data
+        // V5: use the stored overlay URL from v5Data
         if (selectedVersion === 'v5') {
             if (isLoadingV5) return caseData.raw_image.url; // Show raw while loading
             return v5Data?.overlay_image || caseData.raw_image.url;
@@ -317,6 +345,19 @@ export function CasePreviewPage() {
                                 transform: `translate(${position.x}px, ${position.y}px) scale(${scale})`,
                             }}
                         />
+                        {/* Background processing overlay */}
+                        {caseData.is_processing && selectedVersion !== 'raw' && selectedVersion !== 'v5' && (
+                            <div className="processing-overlay">
+                                <div className="spinner" />
+                                <span>Processing...</span>
+                            </div>
+                        )}
+                        {/* Background processing failed, or was cut short by a restart */}
+                        {!caseData.is_processing && !caseData.success_process && selectedVersion !== 'raw' && selectedVersion !== 'v5' && (
+                            <div className="processing-error-overlay">
+                                <span>⚠️ Processing failed for this case</span>
+                            </div>
+                        )}
                         {/* V5 loading overlay */}
                         {selectedVersion === 'v5' && isLoadingV5 && (
                             <div className="v5-loading-overlay">
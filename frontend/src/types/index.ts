@@ -59,6 +59,7 @@ export interface CaseDetail {
     request_id: string;
     created_at: string;
     success_process: boolean;
+    is_processing: boolean; // uploads are processed in the background
     raw_image: RawImage;
     predictions: {
         'v3.5.1': Prediction[];
@@ -81,8 +82,7 @@ export interface IndividualHeatmap {
 
 export interface UploadResponse {
     request_id: string;
-    success: boolean;
-    errors: string[] | null;
+    pending: boolean; // processing continues in the background; poll the case detail
 }
 
 // V5 Experimental API response (on-demand, no DB persistence)
@@ -90,5 +90,5 @@ export interface V5Result {
     request_id: string;
     api_version: string;
     predictions: Prediction[];
-    overlay_image: string | null; // data:image/png;base64,...
+    overlay_image: string | null; // storage URL of the overlay PNG
 }